@@ -0,0 +1,111 @@
+"""
+Checkpoints of interrupted languages.
+
+A checkpoint saves the set being parsed, the position (always the start
+of a line) reached in it, and the accepted words and blacklist at that
+point, so an interrupted (or killed) parse can resume from there.
+The words and blacklist are files in the folder of the language, only
+the ones that changed are written by every checkpoint.
+"""
+
+import json
+import logging
+import os
+import shutil
+from os import fspath
+from pathlib import Path
+
+# Folder where the checkpoints are saved
+checkpoint_path = Path(".cache") / "checkpoints"
+
+# By default, a checkpoint is saved after parsing this many bytes of a set
+default_interval = 256 * 1024 * 1024
+
+
+def get_checkpoint_file(lang: str) -> Path:
+    return Path(checkpoint_path / f"{lang}.json").resolve()
+
+
+def get_checkpoint_directory(lang: str) -> Path:
+    """Folder of the words and blacklist files of a language's checkpoint"""
+    return Path(checkpoint_path / lang).resolve()
+
+
+def get_checkpoint_files(checkpoint: dict) -> set:
+    files = set()
+    for store in [checkpoint["words"], checkpoint["blacklist"]]:
+        if store is not None:
+            files.update(store["runs"])
+            files.update(store["segments"])
+    return files
+
+
+def file_signature(path) -> list:
+    stat = Path(path).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def save_checkpoint(lang: str, checkpoint: dict):
+    """Save the checkpoint, replacing the previous one only once it's written"""
+    path = get_checkpoint_file(lang)
+    path.parent.mkdir(exist_ok=True, parents=True)
+
+    temporary = path.with_name(f"{path.name}.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(json.dumps(checkpoint, ensure_ascii=False))
+    os.replace(temporary, path)
+
+    # * Remove the files of previous checkpoints that are not used anymore
+    used = get_checkpoint_files(checkpoint)
+    for file in get_checkpoint_directory(lang).iterdir():
+        if file.name not in used:
+            file.unlink()
+
+    logging.info(
+        f"Saved checkpoint of {lang} {checkpoint['type']}s at byte {checkpoint['offset']}"
+    )
+
+
+def load_checkpoint(lang: str, wordSet: dict, destination):
+    """
+    Get the checkpoint of a language, if it is still valid: it must be
+    for the same destination and its set can't have changed since.
+    """
+    path = get_checkpoint_file(lang)
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        logging.warning(f'Ignoring unreadable checkpoint "{path}"')
+        return None
+
+    source = Path(wordSet[checkpoint["type"]]).resolve()
+    if checkpoint["destination"] != fspath(destination):
+        logging.warning(f"Ignoring checkpoint of {lang} for another destination")
+        return None
+
+    if not source.exists() or checkpoint["signature"] != file_signature(source):
+        logging.warning(f'Ignoring checkpoint of {lang}, "{source.name}" changed')
+        return None
+
+    directory = get_checkpoint_directory(lang)
+    if not all(
+        (directory / name).exists() for name in get_checkpoint_files(checkpoint)
+    ):
+        logging.warning(f"Ignoring checkpoint of {lang}, some of its files are missing")
+        return None
+
+    logging.info(
+        f"Resuming {lang} {checkpoint['type']}s from byte {checkpoint['offset']}"
+    )
+    return checkpoint
+
+
+def remove_checkpoint(lang: str):
+    path = get_checkpoint_file(lang)
+    if path.exists():
+        path.unlink()
+    shutil.rmtree(get_checkpoint_directory(lang), ignore_errors=True)
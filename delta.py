@@ -0,0 +1,130 @@
+"""
+Deltas between two versions of a dictionary.
+
+Both versions are read as streams and sorted by word with the budget of a
+WordStore (spilling to disk past it), then merged to find the added and
+removed words. The delta is identified by the SHA-256 of both versions,
+so it can only be applied to the version it was computed from.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from wordstore import MemoryBudget, WordStore
+
+# Memory for the words of both versions, past it they are spilled to disk
+default_budget = 64 * 1024 * 1024
+
+
+def get_delta_path(filePath: Path) -> Path:
+    return filePath.with_name(f"{filePath.stem}.delta.json")
+
+
+def read_dictionary(path, digest=None):
+    """
+    Iterate the words of a dictionary saved by `save_dictionary`, which has
+    one word per line. The bytes read are added to the `digest`, if any.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if digest is not None:
+                digest.update(line)
+
+            line = line.strip().rstrip(b",")
+            if line in (b"[", b"]", b"[]", b""):
+                continue
+            yield json.loads(line)
+
+
+def load_version(path, budget: MemoryBudget):
+    """Store the words of a dictionary to iterate them sorted. Returns its hash"""
+    digest = hashlib.sha256()
+    words = WordStore(budget)
+    for word in read_dictionary(path, digest):
+        words.add(word)
+    return words, digest.hexdigest()
+
+
+def diff_sorted(previous, current):
+    """
+    Merge two iterables of words sorted and without duplicates.
+    Yields (True, word) for the added words and (False, word) for the removed.
+    """
+    previous = iter(previous)
+    current = iter(current)
+    old = next(previous, None)
+    new = next(current, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old < new):
+            yield False, old
+            old = next(previous, None)
+        elif old is None or new < old:
+            yield True, new
+            new = next(current, None)
+        else:
+            old = next(previous, None)
+            new = next(current, None)
+
+
+def write_delta(
+    previousPath, currentPath, deltaPath, lang: str, wordType: str, memory_budget=None
+):
+    """
+    Write the delta between two versions of a dictionary. Removed words are
+    kept in a temporary file while the added words are written.
+    Returns the number of added and removed words.
+    """
+    budget = MemoryBudget(memory_budget or default_budget)
+    previous, previousHash = load_version(previousPath, budget)
+    current, currentHash = load_version(currentPath, budget)
+
+    added = removed = 0
+    temporary = deltaPath.with_name(f"{deltaPath.name}.partial")
+    try:
+        with open(temporary, "w", encoding="utf-8") as f, tempfile.TemporaryFile(
+            "w+", encoding="utf-8"
+        ) as removedWords:
+            f.write("{\n")
+            f.write(f'  "lang": {json.dumps(lang)},\n')
+            f.write(f'  "type": {json.dumps(wordType)},\n')
+            f.write(f'  "from": "{previousHash}",\n')
+            f.write(f'  "to": "{currentHash}",\n')
+            f.write('  "added": [')
+
+            for isAdded, word in diff_sorted(
+                (word for word, _ in previous.iter_first()),
+                (word for word, _ in current.iter_first()),
+            ):
+                encoded = json.dumps(word, ensure_ascii=False)
+                if isAdded:
+                    f.write(",\n    " if added else "\n    ")
+                    f.write(encoded)
+                    added += 1
+                else:
+                    removedWords.write(f"{encoded}\n")
+                    removed += 1
+
+            f.write("\n  ],\n" if added else "],\n")
+            f.write('  "removed": [')
+            removedWords.seek(0)
+            for index, line in enumerate(removedWords):
+                f.write(",\n    " if index else "\n    ")
+                f.write(line.rstrip("\n"))
+            f.write("\n  ]\n}" if removed else "]\n}")
+
+        os.replace(temporary, deltaPath)
+    finally:
+        previous.close()
+        current.close()
+        if temporary.exists():
+            temporary.unlink()
+
+    logging.info(
+        f'Created "{deltaPath.name}" with {added} added and {removed} removed words'
+    )
+    return added, removed
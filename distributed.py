@@ -0,0 +1,475 @@
+"""
+Parse the sets with workers on many nodes.
+
+A coordinator splits the sets in (file, byte range) shards and publishes
+them to a SQLite queue in a directory shared by every node. Workers claim
+shards with a lease, which they renew while parsing, and save the result
+of each shard next to the queue. Shards whose lease expired (the worker
+died or was cut off) are claimed again by another worker. As shards are
+done, the coordinator merges them in order into the dictionaries, sharing
+snapshots of the blacklist just like the process pool of parse_data.py.
+The folder of these snapshots is kept in the queue and read by the workers
+with every shard they claim, so a resumed coordinator can replace it.
+A queue is only resumed if its sets and chunk size didn't change since it
+was published, otherwise its shards would not match the sets anymore.
+
+Sets must be found under the same path by every node.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from os import fspath
+from pathlib import Path
+
+from build_data import get_wordsets
+from checkpoint import file_signature
+from parse_data import ChunkMerge, get_chunk_jobs, parse_chunk
+from sharedstate import SharedState, get_snapshot_file
+from utils.scheduler import default_chunk_size
+
+# Default folder of the queue, shared by the coordinator and the workers
+queue_path = Path(".cache") / "queue"
+
+# Seconds a claimed shard is kept by its worker without renewing the lease
+default_lease = 120
+
+# Seconds between every check of the queue
+poll_interval = 1.0
+
+# A shard failing this many times stops the whole build
+max_attempts = 3
+
+
+def get_queue_file(directory) -> Path:
+    return Path(directory) / "queue.db"
+
+
+def get_result_file(directory, shard: int) -> Path:
+    return Path(directory) / "results" / f"{shard}.json"
+
+
+def connect(directory) -> sqlite3.Connection:
+    # Transactions are started explicitly, to claim shards atomically
+    return sqlite3.connect(
+        fspath(get_queue_file(directory)), timeout=30, isolation_level=None
+    )
+
+
+def get_sets_signature(word_sets_files, chunk_size) -> str:
+    """Identify the sets (and how they are split) the shards are cut from"""
+    sets = {}
+    for wordSet in word_sets_files:
+        for wordType in ["noun", "adj"]:
+            path = Path(wordSet[wordType]).resolve()
+            sets[fspath(path)] = file_signature(path) if path.exists() else None
+    return json.dumps({"chunk_size": chunk_size, "sets": sets}, sort_keys=True)
+
+
+def is_same_queue(directory, signature: str) -> bool:
+    conn = connect(directory)
+    row = conn.execute("SELECT value FROM queue WHERE key = 'sets'").fetchone()
+    conn.close()
+    return row is not None and row[0] == signature
+
+
+def remove_queue(directory):
+    shutil.rmtree(Path(directory) / "results", ignore_errors=True)
+    get_queue_file(directory).unlink()
+
+
+def publish_shards(directory, jobs: list[dict], shared: Path, signature: str):
+    """
+    Create the queue with a shard for every job, the `shared` folder of the
+    coordinator and the `signature` of the sets. The queue is written to a
+    temporary file first, so workers never see it half published.
+    """
+    directory = Path(directory)
+    (directory / "results").mkdir(exist_ok=True, parents=True)
+    path = get_queue_file(directory)
+    temporary = path.with_name(f"{path.name}.tmp")
+    if temporary.exists():
+        temporary.unlink()
+
+    conn = sqlite3.connect(fspath(temporary))
+    with conn:
+        conn.execute("""
+            CREATE TABLE shards (
+                id INTEGER PRIMARY KEY,
+                job TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+            """)
+        conn.execute("CREATE TABLE queue (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany(
+            "INSERT INTO queue (key, value) VALUES (?, ?)",
+            [("shared", fspath(shared)), ("sets", signature)],
+        )
+        conn.executemany(
+            "INSERT INTO shards (id, job, size) VALUES (?, ?, ?)",
+            [(id, json.dumps(job), job["size"]) for id, job in enumerate(jobs)],
+        )
+    conn.close()
+
+    os.replace(temporary, path)
+    logging.info(f"Published {len(jobs)} shards to {path}")
+
+
+def resume_shards(conn: sqlite3.Connection, shared: Path) -> int:
+    """
+    Replace the `shared` folder of the queue and release the shards that
+    failed or were leased by the previous run, with their attempts.
+    Returns the number of shards released.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE queue SET value = ? WHERE key = 'shared'", (fspath(shared),)
+        )
+        cursor = conn.execute("""
+            UPDATE shards SET state = 'pending', worker = NULL,
+            lease_until = NULL, attempts = 0, error = NULL
+            WHERE state IN ('failed', 'leased')
+            """)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.rowcount
+
+
+def claim_shard(conn: sqlite3.Connection, worker: str, lease=default_lease):
+    """
+    Claim the largest pending shard, or one whose lease expired.
+    Returns its (id, job), None if there is nothing to claim.
+    Nothing is claimed while the shared folder of the queue is missing,
+    until a coordinator resumes it.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        (shared,) = conn.execute(
+            "SELECT value FROM queue WHERE key = 'shared'"
+        ).fetchone()
+        if not Path(shared).exists():
+            conn.execute("COMMIT")
+            return None
+
+        row = conn.execute(
+            """
+            SELECT id, job FROM shards
+            WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?)
+            ORDER BY size DESC, id LIMIT 1
+            """,
+            (now,),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                """
+                UPDATE shards SET state = 'leased', worker = ?, lease_until = ?,
+                attempts = attempts + 1 WHERE id = ?
+                """,
+                (worker, now + lease, row[0]),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    if row is None:
+        return None
+
+    job = json.loads(row[1])
+    job["shared"] = shared
+    job["snapshot"] = fspath(get_snapshot_file(shared, job["lang"]))
+    return row[0], job
+
+
+def renew_lease(conn, shard: int, worker: str, lease=default_lease) -> bool:
+    """Extend the lease of a shard. False if the worker lost it"""
+    cursor = conn.execute(
+        """
+        UPDATE shards SET lease_until = ?
+        WHERE id = ? AND worker = ? AND state = 'leased'
+        """,
+        (time.time() + lease, shard, worker),
+    )
+    return cursor.rowcount == 1
+
+
+def complete_shard(conn, shard: int, worker: str) -> bool:
+    cursor = conn.execute(
+        """
+        UPDATE shards SET state = 'done', lease_until = NULL
+        WHERE id = ? AND worker = ? AND state = 'leased'
+        """,
+        (shard, worker),
+    )
+    return cursor.rowcount == 1
+
+
+def fail_shard(conn, shard: int, worker: str, error: str):
+    """Release the shard so it can be claimed again, unless it failed too often"""
+    conn.execute(
+        """
+        UPDATE shards SET state = CASE WHEN attempts >= ? THEN 'failed'
+        ELSE 'pending' END, lease_until = NULL, error = ?
+        WHERE id = ? AND worker = ? AND state = 'leased'
+        """,
+        (max_attempts, error, shard, worker),
+    )
+
+
+def count_states(conn) -> dict:
+    rows = conn.execute("SELECT state, COUNT(*) FROM shards GROUP BY state")
+    return dict(rows.fetchall())
+
+
+def save_result(path: Path, result):
+    words, blacklist = result
+    temporary = path.with_name(f"{path.name}.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"words": words, "blacklist": list(blacklist)}))
+    os.replace(temporary, path)
+
+
+def load_result(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    return result["words"], result["blacklist"]
+
+
+def keep_lease(directory, shard: int, worker: str, lease, stop: threading.Event):
+    """Renew the lease of a shard until `stop` is set"""
+    conn = connect(directory)
+    while not stop.wait(lease / 3):
+        if not renew_lease(conn, shard, worker, lease):
+            logging.warning(f"Worker {worker} lost the lease of shard {shard}")
+            break
+    conn.close()
+
+
+def run_worker(directory, worker=None, lease=default_lease):
+    """
+    Claim and parse shards until every shard of the queue is done.
+    Waits for the queue to be published if it doesn't exist yet.
+    """
+    if worker is None:
+        worker = f"{socket.gethostname()}-{os.getpid()}"
+
+    while not get_queue_file(directory).exists():
+        time.sleep(poll_interval)
+
+    conn = connect(directory)
+    parsed = 0
+    while True:
+        claimed = claim_shard(conn, worker, lease)
+        if claimed is None:
+            states = count_states(conn)
+            if not states.get("pending") and not states.get("leased"):
+                break
+            # Other workers have the remaining shards, in case they die
+            time.sleep(poll_interval)
+            continue
+
+        shard, job = claimed
+        logging.info(f"Worker {worker} parsing shard {shard} ({job['path']})")
+        stop = threading.Event()
+        renewer = threading.Thread(
+            target=keep_lease, args=(directory, shard, worker, lease, stop)
+        )
+        renewer.start()
+        try:
+            _, result = parse_chunk(job)
+            save_result(get_result_file(directory, shard), result)
+        except Exception as err:
+            logging.exception(f"Worker {worker} failed shard {shard}")
+            fail_shard(conn, shard, worker, repr(err))
+            continue
+        finally:
+            stop.set()
+            renewer.join()
+
+        if complete_shard(conn, shard, worker):
+            parsed += 1
+
+    conn.close()
+    logging.info(f"Worker {worker} finished after parsing {parsed} shards")
+
+
+def run_coordinator(
+    directory,
+    word_sets_files,
+    chunk_size=default_chunk_size,
+    memory_budget=None,
+    workers=0,
+    lease=default_lease,
+):
+    """
+    Publish the shards (or resume the queue, if it already exists) and merge
+    them into the dictionaries as they are done. Shards that failed before
+    are tried again, but a queue whose sets changed is published again. `workers` local processes are started to parse the
+    shards once the queue is ready. Returns False if any shard failed.
+    """
+    directory = Path(directory).resolve()
+    directory.mkdir(exist_ok=True, parents=True)
+    shared = SharedState(directory / "shared")
+
+    signature = get_sets_signature(word_sets_files, chunk_size)
+    if get_queue_file(directory).exists() and not is_same_queue(directory, signature):
+        logging.warning("The sets changed since the queue was published, starting over")
+        remove_queue(directory)
+
+    if get_queue_file(directory).exists():
+        logging.info(f"Resuming queue {get_queue_file(directory)}")
+        conn = connect(directory)
+        rows = conn.execute("SELECT job FROM shards ORDER BY id").fetchall()
+        jobs = [json.loads(job) for (job,) in rows]
+        released = resume_shards(conn, shared.directory)
+        logging.info(f"Released {released} shards of the previous run")
+    else:
+        jobs = get_chunk_jobs(word_sets_files, None, chunk_size)
+        publish_shards(directory, jobs, shared.directory, signature)
+        conn = connect(directory)
+
+    # * Started once the queue points to the shared folder of this coordinator
+    processes = []
+    for index in range(workers):
+        process = multiprocessing.Process(
+            target=run_worker, args=(directory, f"local-{index}", lease)
+        )
+        process.start()
+        processes.append(process)
+
+    languages = {}
+    for job in jobs:
+        languages.setdefault(job["lang"], []).append(job)
+
+    merges = {
+        lang: ChunkMerge(lang, langJobs, None, memory_budget, shared)
+        for lang, langJobs in languages.items()
+    }
+
+    merged = set()
+    failed = False
+    while len(merged) < len(jobs) and not failed:
+        # Checked before reading the queue, so their last shards are seen
+        alive = not processes or any(process.is_alive() for process in processes)
+
+        rows = conn.execute("SELECT id, state, error FROM shards").fetchall()
+        for shard, state, error in rows:
+            if state == "failed":
+                logging.critical(f"Shard {shard} failed: {error}")
+                failed = True
+            elif state == "done" and shard not in merged:
+                job = jobs[shard]
+                result = load_result(get_result_file(directory, shard))
+                merges[job["lang"]].add(job, result)
+                merged.add(shard)
+
+        if len(merged) < len(jobs) and not alive:
+            logging.critical("Every worker stopped before all shards were done")
+            failed = True
+        elif len(merged) < len(jobs):
+            time.sleep(poll_interval)
+
+    for process in processes:
+        if failed:
+            process.terminate()
+        process.join()
+
+    conn.close()
+    shared.close()
+    if failed:
+        return False
+
+    # * The queue is removed, so the next build publishes new shards
+    remove_queue(directory)
+    logging.info(f"Merged {len(merged)} shards into the dictionaries")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    logging.root.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Parse the nouns and adjectives sets with workers on many nodes"
+    )
+    parser.add_argument(
+        "mode",
+        choices=["coordinator", "worker", "local"],
+        help="Publish and merge the shards, parse them, or both with local workers",
+    )
+    parser.add_argument(
+        "--queue",
+        default=fspath(queue_path),
+        help="Directory of the queue, shared by the coordinator and every worker",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of worker processes of the local mode",
+    )
+    parser.add_argument(
+        "--name",
+        default=None,
+        help="Name of the worker (by default, the host name and process id)",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=default_lease,
+        help="Seconds a shard is kept by a worker that stopped renewing it",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=default_chunk_size // (1024 * 1024),
+        dest="chunk_size",
+        help="Size (in MB) of the shards the sets are split in",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        dest="memory_budget",
+        help="Memory (in MB) to merge the words of a language, past it words are spilled to disk",
+    )
+    args = parser.parse_args()
+
+    if args.mode == "worker":
+        run_worker(args.queue, args.name, args.lease)
+        sys.exit(0)
+
+    word_sets_files = get_wordsets()
+    if word_sets_files is None:
+        sys.exit(1)
+
+    memory_budget = None
+    if args.memory_budget is not None:
+        memory_budget = args.memory_budget * 1024 * 1024
+
+    completed = run_coordinator(
+        args.queue,
+        word_sets_files,
+        args.chunk_size * 1024 * 1024,
+        memory_budget,
+        args.workers if args.mode == "local" else 0,
+        args.lease,
+    )
+    sys.exit(0 if completed else 1)
@@ -0,0 +1,226 @@
+"""
+Evaluate many filter configurations with a single pass over the sets.
+
+Every line of a language's sets is read once, recording the reasons the
+word would be rejected for (malformed, blacklisted tags, unicode
+characters, tokenization) and its frequency. With those records, the
+words kept by any frequency threshold and tags blacklist are counted
+without reading the sets again.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from pathlib import Path
+
+from wordfreq import word_frequency
+
+from build_data import get_wordsets
+from filters import (
+    __blacklisted_tags__,
+    __frequency_threshold__,
+    get_word_tags,
+    has_blacklisted_tag,
+    has_blacklisted_unicode,
+    is_line_blacklisted,
+    is_tokenized_too_long,
+    is_word_malformed,
+)
+from reader import BlockReader
+
+
+def record_language(lang: str, wordSet: dict) -> dict:
+    """
+    Read the nouns and adjectives of a language, in the same order
+    they are parsed, and record what every filter says about each word.
+    Lines of malformed words are not recorded, no filter would keep them.
+    """
+    lines = {}
+    words = {}
+
+    for wordType in ["noun", "adj"]:
+        path = Path(wordSet[wordType]).resolve()
+        records = lines[wordType] = []
+        if not path.exists():
+            logging.error(f'File "{path.name}" does not exists in directory')
+            continue
+
+        logging.info(f"Recording {lang} {wordType}s from {path}...")
+        with BlockReader(path, prefilter=is_line_blacklisted) as reader:
+            for line in reader:
+                if line is None:
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                word = data["word"].lower()
+                if is_word_malformed(word):
+                    continue
+
+                records.append((word, frozenset(get_word_tags(data))))
+                if word not in words:
+                    words[word] = get_word_reasons(word, lang)
+
+    return {"lang": lang, "lines": lines, "words": words}
+
+
+def get_word_reasons(word: str, lang: str) -> dict:
+    """Reasons (that only depend on the word) to reject it, and its frequency"""
+    reasons = []
+    if has_blacklisted_unicode(word):
+        reasons.append("unicode")
+    if is_tokenized_too_long(word, lang):
+        reasons.append("tokenization")
+
+    return {"reasons": reasons, "frequency": word_frequency(word, lang)}
+
+
+def count_kept(records: dict, threshold: float, blacklisted_tags) -> dict:
+    """
+    Replay the filters over the recorded lines, just as `is_tag_blacklisted`
+    and `is_word_used` would do, and count the words kept of each type
+    """
+    words = records["words"]
+    blacklist = set()
+    kept = {}
+
+    for wordType, lines in records["lines"].items():
+        accepted = set()
+        for word, tags in lines:
+            if has_blacklisted_tag(tags, blacklisted_tags):
+                blacklist.add(word)
+                continue
+
+            if word in blacklist:
+                continue
+
+            reasons = words[word]["reasons"]
+            if "unicode" in reasons:
+                blacklist.add(word)
+                continue
+
+            if "tokenization" not in reasons and words[word]["frequency"] > threshold:
+                accepted.add(word)
+
+        kept[wordType] = len(accepted)
+
+    return kept
+
+
+def get_blacklists(add_tags, drop_tags, leave_one_out=False) -> dict:
+    """Tags blacklists to evaluate, by name"""
+    blacklists = {"default": list(__blacklisted_tags__)}
+
+    if leave_one_out:
+        drop_tags = list(__blacklisted_tags__)
+
+    for tag in drop_tags:
+        blacklists[f"-{tag}"] = [t for t in __blacklisted_tags__ if t != tag]
+    for tag in add_tags:
+        blacklists[f"+{tag}"] = list(__blacklisted_tags__) + [tag]
+
+    return blacklists
+
+
+def evaluate(records: dict, thresholds, blacklists: dict) -> list[dict]:
+    rows = []
+    for threshold in thresholds:
+        for name, tags in blacklists.items():
+            kept = count_kept(records, threshold, tags)
+            rows.append(
+                {
+                    "lang": records["lang"],
+                    "threshold": threshold,
+                    "blacklist": name,
+                    "nouns": kept.get("noun", 0),
+                    "adjs": kept.get("adj", 0),
+                }
+            )
+    return rows
+
+
+def save_rows(rows: list[dict], output):
+    fields = ["lang", "threshold", "blacklist", "nouns", "adjs"]
+    if output is None:
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+
+    output = Path(output).resolve()
+    output.parent.mkdir(exist_ok=True, parents=True)
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        if output.suffix == ".json":
+            f.write(json.dumps(rows, indent=2))
+        else:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    logging.info(f"Saved evaluation of {len(rows)} configurations to {output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Count the words kept by many filter configurations"
+    )
+    parser.add_argument(
+        "--lang",
+        nargs="+",
+        default=None,
+        dest="languages",
+        help="Languages to evaluate (by default, all the sets)",
+    )
+    parser.add_argument(
+        "--thresholds",
+        nargs="+",
+        type=float,
+        default=[__frequency_threshold__],
+        help="Frequency thresholds to evaluate",
+    )
+    parser.add_argument(
+        "--add-tag",
+        nargs="+",
+        default=[],
+        dest="add_tags",
+        help="Evaluate the blacklist with each of these tags added",
+    )
+    parser.add_argument(
+        "--drop-tag",
+        nargs="+",
+        default=[],
+        dest="drop_tags",
+        help="Evaluate the blacklist without each of these tags",
+    )
+    parser.add_argument(
+        "--leave-one-out",
+        action="store_true",
+        help="Evaluate the blacklist without each one of its tags",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=None,
+        help="CSV or JSON file to save the results (by default, printed as CSV)",
+    )
+    args = parser.parse_args()
+
+    word_sets_files = get_wordsets()
+    if word_sets_files is None:
+        sys.exit(1)
+
+    blacklists = get_blacklists(args.add_tags, args.drop_tags, args.leave_one_out)
+
+    rows = []
+    for wordSet in word_sets_files:
+        if args.languages and wordSet["lang"] not in args.languages:
+            continue
+        records = record_language(wordSet["lang"], wordSet)
+        rows += evaluate(records, args.thresholds, blacklists)
+
+    save_rows(rows, args.output)
@@ -1,7 +1,10 @@
 import logging
 import re
+from functools import lru_cache
 
+import langcodes
 from wordfreq import tokenize, word_frequency
+from wordfreq.language_info import get_language_info
 
 __blacklisted_tags__ = [
     # Run utils/get_tags.py to get all tags from sets more easily
@@ -147,6 +150,25 @@ __blacklisted_characters__re = re.compile(
     flags=re.IGNORECASE | re.VERBOSE | re.UNICODE,
 )
 
+"""
+* Prefilter of the raw lines of a set. The word is found without decoding
+* the JSON, and only the characters checked by `is_word_malformed` are
+* used, so any line rejected here would be rejected by `is_tag_blacklisted`.
+"""
+__blacklisted_bytes__ = frozenset(
+    b"0123456789" + bytes(c for c in map(ord, __blacklisted_characters__) if c < 128)
+)
+__word_key__ = b'"word":'
+# Only words without escape sequences are matched
+__word_value__re = re.compile(rb'"word": ?"([^"\\]*)"')
+
+# Minimum frequency of a word to be used
+__frequency_threshold__ = 5.62e-06  # 0.00000562
+
+# * Bitmap of blacklisted codepoints published by sharedstate.py,
+# * used by the workers of a pool instead of the regex
+__blacklisted_codepoints__ = None
+
 __wasblacklisted__ = set()
 
 
@@ -155,10 +177,10 @@ def clear_blacklisted():
     __wasblacklisted__.clear()
 
 
-def save_blacklisted_word(word, type="known", altOf=None):
+def save_blacklisted_word(word, type="known", altOf=None, blacklist=__wasblacklisted__):
     logging.info(f"Adding word to blacklist: {word}")
     if type == "known":
-        __wasblacklisted__.add(word)
+        blacklist.add(word)
         logging.debug(f"{type}\t{word}\n")
 
     else:
@@ -186,7 +208,7 @@ def get_word_tags(data: dict):
     return tags
 
 
-def blacklist_synonyms(data: dict):
+def blacklist_synonyms(data: dict, blacklist=__wasblacklisted__):
     alts = set()
 
     if "forms" in data:
@@ -199,19 +221,43 @@ def blacklist_synonyms(data: dict):
 
     logging.debug(f"Found a total of {len(alts)} synonyms for the word {data['word']}")
     for word in alts:
-        save_blacklisted_word(word, "alt-of", data["word"])
+        save_blacklisted_word(word, "alt-of", data["word"], blacklist)
 
 
-def add_word_to_blacklist(word, data: dict):
+def add_word_to_blacklist(word, data: dict, blacklist=__wasblacklisted__):
     """
     Add the given word to the blacklist and
     all it's synonyms/alternative-forms.
     """
-    save_blacklisted_word(word)
-    blacklist_synonyms(data)
+    save_blacklisted_word(word, blacklist=blacklist)
+    blacklist_synonyms(data, blacklist)
+
+
+def is_line_blacklisted(line: bytes) -> bool:
+    """
+    Check the raw line of a set before parsing it.
+    As nested objects (like synonyms) also have a "word" key, the
+    line is only rejected when all of them would be rejected.
+    """
+    values = __word_value__re.findall(line)
+    if not values or len(values) != line.count(__word_key__):
+        return False
+
+    for value in values:
+        if len(value.split(maxsplit=1)) > 1:
+            continue
+        if any(byte in __blacklisted_bytes__ for byte in value):
+            continue
+        return False
 
+    return True
 
-def is_tag_blacklisted(data, word):
+
+def is_word_malformed(word) -> bool:
+    """
+    Check if the word is spaced or contains numbers or basic blacklisted
+    characters. These checks don't depend on the tags or the blacklist.
+    """
     # If word is spaced, then is probably a say and should be skipped
     # Instead of regex, use split as the default includes all whitespaced characters
     # Max split is set to 1 as checking multiple spaces is pointless
@@ -229,36 +275,143 @@ def is_tag_blacklisted(data, word):
             logging.debug(f"({char}) - {word} contains a blacklisted character")
             return True
 
+    return False
+
+
+def has_blacklisted_unicode(word) -> bool:
+    bitmap = __blacklisted_codepoints__
+    if bitmap is not None:
+        # The regex only matches the first character of the word
+        if not word:
+            return False
+        codepoint = ord(word[0])
+        return bool(bitmap[codepoint >> 3] & (1 << (codepoint & 7)))
+
+    return bool(__blacklisted_characters__re.match(rf"{re.escape(word)}"))
+
+
+def has_blacklisted_tag(tags, blacklisted_tags=__blacklisted_tags__) -> bool:
+    return bool(tags) and any(i in tags for i in blacklisted_tags)
+
+
+def is_tag_blacklisted(data, word, blacklist=__wasblacklisted__):
+    """
+    Check if the word should be ignored. Any blacklisted word is saved
+    to the given blacklist (by default, the global blacklist), so
+    separated chunks of a set can be filtered at the same time.
+    """
+    if is_word_malformed(word):
+        return True
+
     # Get tags
     tags = get_word_tags(data)
 
     # Check if contains any blacklisted tag
-    if tags and any(i in tags for i in __blacklisted_tags__):
+    if has_blacklisted_tag(tags):
         logging.debug(f"{word} contains a blacklisted tag")
-        add_word_to_blacklist(word, data)
+        add_word_to_blacklist(word, data, blacklist)
         return True
 
     # Check if was previously blacklisted
     # ! __wasblacklisted__ set size may degrade performance over time
-    if word in __wasblacklisted__:
+    if word in blacklist:
         logging.debug(f"Word was previously blacklisted: {word}")
         return True
 
     # Fully check if contains a blacklisted character using regex
-    if bool(__blacklisted_characters__re.match(rf"{re.escape(word)}")):
+    if has_blacklisted_unicode(word):
         logging.debug(f"{word} contains a blacklisted unicode character!")
-        save_blacklisted_word(word)
+        save_blacklisted_word(word, blacklist=blacklist)
         return True
 
     # * Not a blacklisted word
     return False
 
 
+"""
+* Scripts where every letter is a word character for Wordfreq's regex
+* tokenizer, so a word made only of these letters is a single token.
+* Latin, IPA and spacing modifiers, Greek, Cyrillic, Armenian, Hebrew,
+* Arabic, Georgian, Latin Extended Additional and Greek Extended.
+"""
+__single_token_ranges__ = (
+    (0x0041, 0x02FF),
+    (0x0370, 0x06FF),
+    (0x10A0, 0x10FF),
+    (0x1E00, 0x1FFF),
+)
+# Letters that are removed or split by the preprocessing of some languages
+# (Greek ypogegrammeni is split by NFKC and tatweel is removed in Arabic)
+__unsafe_letters__ = frozenset("\u037a\u0640")
+
+
+@lru_cache(maxsize=None)
+def has_simple_tokenizer(lang: str) -> bool:
+    """
+    Check if Wordfreq tokenizes the language with its regex tokenizer
+    and without transliterating it (as Serbian or Azerbaijani).
+    """
+    try:
+        info = get_language_info(langcodes.get(lang))
+    except (LookupError, ValueError):
+        # Not a valid language tag
+        return False
+    return info["tokenizer"] == "regex" and not info["transliteration"]
+
+
+__single_token__re = re.compile(
+    "[%s]+"
+    % "".join(
+        re.escape(chr(codepoint))
+        for start, end in __single_token_ranges__
+        for codepoint in range(start, end + 1)
+        if chr(codepoint).isalpha() and chr(codepoint) not in __unsafe_letters__
+    )
+)
+
+
+def is_single_token(word: str) -> bool:
+    return __single_token__re.fullmatch(word) is not None
+
+
+__latin_word__re = re.compile(
+    "[%s]+"
+    % "".join(
+        re.escape(chr(codepoint))
+        for codepoint in range(0x0041, 0x0250)
+        if chr(codepoint).isalpha()
+    )
+)
+
+
+@lru_cache(maxsize=2**18)
+def count_tokens(word: str, lang: str) -> int:
+    return len(tokenize(word, lang))
+
+
+def is_tokenized_too_long(word: str, lang: str) -> bool:
+    # As some of the words may be hyphenated words,
+    # we separate and reject any words that tokenize to more than two words
+    if has_simple_tokenizer(lang):
+        # * Cheap checks before tokenizing: a word made of letters is a
+        # * single token, and a hyphen always splits Latin words
+        if is_single_token(word):
+            return False
+
+        parts = word.split("-")
+        if len(parts) > 2 and all(__latin_word__re.fullmatch(part) for part in parts):
+            return True
+
+    # Tokenizing is expensive (mostly for CJK languages), so it's cached
+    return count_tokens(word, lang) > 2
+
+
 def is_word_used(
     word: str,
     lang: str,
     wordlist: str = "best",
     minimum: float = 0.0,
+    threshold: float = __frequency_threshold__,
 ) -> bool:
     """
     `is_word_used` returns the frequency of a word in a language
@@ -271,15 +424,15 @@ def is_word_used(
     :type wordlist: str (optional)
     :param minimum: The minimum frequency of the word in the wordlist
     :type minimum: float
+    :param threshold: Words must be more frequent than this to be used
+    :type threshold: float
     :return: A bool
     """
 
-    # As some of the words may be hyphenated words,
-    # we separate and reject any words that tokenize to more than two words
-    if len(tokenize(word, lang)) > 2:
+    if is_tokenized_too_long(word, lang):
         logging.info(f"Ignoring word by tokenization length: {word}")
         return False
 
     frequency = word_frequency(word, lang, wordlist, minimum)
-    is_used = frequency > 5.62e-06  # 0.00000562
+    is_used = frequency > threshold
     return is_used
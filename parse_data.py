@@ -1,55 +1,212 @@
+import argparse
 import json
 import logging
+import os
+import signal
+from os import fspath
 from pathlib import Path
+from time import perf_counter as wallTime
 from time import process_time as perfTime
 
 from build_data import get_wordsets
-from filters import clear_blacklisted, is_tag_blacklisted, is_word_used
+from checkpoint import (
+    default_interval,
+    file_signature,
+    get_checkpoint_directory,
+    load_checkpoint,
+    remove_checkpoint,
+    save_checkpoint,
+)
+from delta import get_delta_path, write_delta
+from filters import (
+    __wasblacklisted__,
+    is_line_blacklisted,
+    is_tag_blacklisted,
+    is_word_used,
+)
+from reader import BlockReader
+from sharedstate import SharedBlacklist, SharedState, attach, snapshot_growth
+from utils.scheduler import default_chunk_size, io_slot, run_jobs, split_file
+from wordstore import MemoryBudget, WordStore
 
 # Your sets to get the words from
 word_sets_files = get_wordsets()
 
 
 # * Save to file
-def save_dictionary(filePath, lang, wordType, words):
+def save_dictionary(filePath, lang, wordType, words: WordStore, delta=False):
     filePath.parent.mkdir(exist_ok=True, parents=True)
-    with open(filePath, "w", encoding="utf-8") as f:
-        # * Sort if needed
-        matches = sorted(list(words), key=len)
-        f.write(json.dumps(matches, ensure_ascii=False, indent=2))
-        logging.info(
-            f'Created "{lang}_{wordType}.json" with a total of {len(words)} {wordType}s'
+
+    # * The dictionary is written to a temporary file and then renamed,
+    # * so an incomplete dictionary is never mistaken for a complete one
+    temporary = filePath.with_name(f"{filePath.name}.partial")
+    with open(temporary, "w", encoding="utf-8") as f:
+        # * Words are streamed, as spilled words are never fully loaded.
+        # * The output is the same as json.dumps(words, indent=2)
+        total = 0
+        for word in words.ordered():
+            f.write("[\n  " if not total else ",\n  ")
+            f.write(json.dumps(word, ensure_ascii=False))
+            total += 1
+        f.write("\n]" if total else "[]")
+
+    # * Compare with the previous version before replacing it
+    if delta and filePath.exists():
+        write_delta(
+            filePath,
+            temporary,
+            get_delta_path(filePath),
+            lang,
+            wordType,
+            words.budget.limit,
         )
 
+    os.replace(temporary, filePath)
+    logging.info(
+        f'Created "{lang}_{wordType}.json" with a total of {total} {wordType}s'
+    )
+
 
 # *  Flag to handle interruptions
 __INTERRUPTED__ = False
 
 
-def handle_wordsets(lang: str, wordSet, destination=None):
+def handle_interrupt(signum, frame):
+    """
+    Stop parsing after the current block, so a checkpoint can be saved.
+    A second interruption stops immediately.
+    """
     global __INTERRUPTED__
-    logging.debug(f"Handling language: {lang}")
+    if __INTERRUPTED__:
+        raise KeyboardInterrupt
+
+    logging.warning("Interrupted, stopping after the current block...")
+    __INTERRUPTED__ = True
+
+
+def parse_lines(
+    lang: str,
+    lines,
+    words: WordStore,
+    blacklist=__wasblacklisted__,
+    name="",
+    first_line=1,
+):
+    """
+    Filter every line (a JSON document as bytes) of a set and add
+    the accepted words to `words`. Lines already rejected by the
+    prefilter are None. Returns the number of ignored words.
+    """
+    # * As every line is it's own object, we need to loop every line
+    # * If we try to parse it with json, then an error will be raised.
+    totalIgnored = 0
+    for line_number, line in enumerate(lines, first_line):
+        if line is None:
+            totalIgnored += 1
+            continue
+
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            logging.error(f"Error parsing {name} at line {line_number}")
+            continue
+        thisWord = data["word"].lower()
 
+        if is_tag_blacklisted(data, thisWord, blacklist):
+            totalIgnored += 1
+            logging.debug(f"{thisWord} is blacklisted.")
+            continue
+
+        if is_word_used(thisWord, lang):
+            words.add(thisWord)
+
+    return totalIgnored
+
+
+def get_output_path(destination, lang, wordType):
     if destination is None:
         destination = Path("dict").resolve()
     else:
-        if type(destination) is not str:
-            logging.critical("The destination path expected a string")
-            return
         destination = Path(destination).resolve()
+    return Path(destination / f"{lang}_{wordType}.json").resolve()
 
-    for wordFile in [wordSet["noun"], wordSet["adj"]]:
+
+def get_checkpoint(
+    lang, wordType, source, offset, words, blacklist, destination
+) -> dict:
+    directory = get_checkpoint_directory(lang)
+    return {
+        "destination": fspath(destination),
+        "type": wordType,
+        "signature": file_signature(source),
+        "offset": offset,
+        "position": blacklist.budget.position,
+        "words": words.checkpoint(directory) if words is not None else None,
+        "blacklist": blacklist.checkpoint(directory),
+    }
+
+
+def handle_wordsets(
+    lang: str,
+    wordSet,
+    destination=None,
+    memory_budget=None,
+    checkpoint_interval=default_interval,
+    delta=False,
+):
+    """
+    Parse the nouns and adjectives of a language. If a `memory_budget`
+    (in bytes) is given, words and blacklist are spilled to disk past it.
+    A checkpoint is saved every `checkpoint_interval` bytes and when the
+    parse is interrupted, and the next call resumes from it.
+    With `delta`, existing dictionaries are parsed again and a delta
+    with the words added and removed from them is saved.
+    """
+    global __INTERRUPTED__
+    logging.debug(f"Handling language: {lang}")
+
+    if destination is not None and type(destination) is not str:
+        logging.critical("The destination path expected a string")
+        return
+
+    outputs = {
+        wordType: get_output_path(destination, lang, wordType)
+        for wordType in ["noun", "adj"]
+    }
+    destinationPath = outputs["noun"].parent
+
+    # * The blacklist keeps the position of every word to compare it
+    # * with the words that were spilled to disk
+    budget = MemoryBudget(memory_budget)
+    blacklist = WordStore(budget)
+
+    wordTypes = ["noun", "adj"]
+    checkpoint = load_checkpoint(lang, wordSet, destinationPath)
+    if checkpoint is not None:
+        if checkpoint["type"] == "adj" and not outputs["noun"].exists():
+            logging.warning(f"Ignoring checkpoint of {lang}, nouns were not saved")
+            checkpoint = None
+        elif outputs[checkpoint["type"]].exists() and not delta:
+            # * Its set is skipped, so the blacklist would be partial
+            logging.warning(
+                f"Ignoring checkpoint of {lang}, {checkpoint['type']}s were already saved"
+            )
+            checkpoint = None
+        else:
+            wordTypes = wordTypes[wordTypes.index(checkpoint["type"]) :]
+            budget.position = checkpoint["position"]
+            blacklist.restore(get_checkpoint_directory(lang), checkpoint["blacklist"])
+
+    for wordType in wordTypes:
         if __INTERRUPTED__:
             break
 
-        # * Get current word type (noun or adj)
-        wordType = [k for k, v in wordSet.items() if v == wordFile][0]
-        directory = Path(wordFile).resolve()
+        directory = Path(wordSet[wordType]).resolve()
         logging.info(f"Parsing {lang} for {wordType} in {directory}...")
 
-        filePath = Path(destination / f"{lang}_{wordType}.json").resolve()
+        filePath = outputs[wordType]
 
-        if filePath.exists():
+        if filePath.exists() and not delta:
             # TODO: add ability to override existing content
             logging.info(f'File "{directory.name}" already exists.')
             continue
@@ -58,43 +215,268 @@ def handle_wordsets(lang: str, wordSet, destination=None):
             logging.error(f'File "{directory.name}" does not exists in directory')
             continue
 
-        with open(f"{directory}", "r", encoding="utf-8") as f:
-            # * To avoid duplicated words, we need to create a set.
-            # * If you will like to also check for duplicates, then replace it with an
-            # * array, replace line 32 'add' with 'append' and uncomment the bottom lines.
-            words = set()
+        # * To avoid duplicated words, we need to create a set.
+        words = WordStore(budget, blacklist)
+        offset = 0
+        if checkpoint is not None and checkpoint["type"] == wordType:
+            if checkpoint["words"] is not None:
+                words.restore(get_checkpoint_directory(lang), checkpoint["words"])
+            offset = checkpoint["offset"]
+        checkpoint = None
+
+        with BlockReader(directory, offset, prefilter=is_line_blacklisted) as reader:
+            totalIgnored = 0
+            line_number = 1
+            nextCheckpoint = offset + checkpoint_interval
             try:
-                # * As every line is it's own object, we need to loop every line
-                # * If we try to parse it with json, then an error will be raised.
-                totalIgnored = 0
-                for line_number, line in enumerate(f, 1):
-                    try:
-                        data = json.loads(line)
-                    except json.JSONDecodeError:
-                        logging.error(
-                            f"Error parsing {directory.name} at line {line_number}"
+                for lines, end in reader.blocks():
+                    totalIgnored += parse_lines(
+                        lang, lines, words, blacklist, directory.name, line_number
+                    )
+                    line_number += len(lines)
+
+                    # * Checkpoints are only saved between blocks, where
+                    # * words and blacklist match the position in the set
+                    if __INTERRUPTED__ or (
+                        checkpoint_interval and end >= nextCheckpoint
+                    ):
+                        save_checkpoint(
+                            lang,
+                            get_checkpoint(
+                                lang,
+                                wordType,
+                                directory,
+                                end,
+                                words,
+                                blacklist,
+                                destinationPath,
+                            ),
                         )
-                        continue
-                    thisWord = data["word"].lower()
+                        nextCheckpoint = end + checkpoint_interval
 
-                    if is_tag_blacklisted(data, thisWord):
-                        totalIgnored += 1
-                        logging.debug(f"{thisWord} is blacklisted.")
-                        continue
+                    if __INTERRUPTED__:
+                        break
 
-                    if is_word_used(thisWord, lang):
-                        words.add(thisWord)
+            # The words of a block being parsed don't match any position
+            # of the set, so only the last checkpoint can be resumed
+            except KeyboardInterrupt:
+                __INTERRUPTED__ = True
+
+            if __INTERRUPTED__:
+                # Partial words are never saved as a complete dictionary
+                logging.warning(f"Parsing of {lang} {wordType}s was interrupted")
+                words.close()
+                break
+
+            logging.info(
+                f"A total of {totalIgnored} words where ignored for the {lang} language"
+            )
+            reader.log_metrics(directory.name)
+
+        save_dictionary(filePath, lang, wordType, words, delta)
+        words.close()
+
+        # * Keep the blacklist of the nouns in case the adjectives are interrupted
+        if wordType == "noun" and checkpoint_interval:
+            save_checkpoint(
+                lang,
+                get_checkpoint(
+                    lang,
+                    "adj",
+                    Path(wordSet["adj"]).resolve(),
+                    0,
+                    None,
+                    blacklist,
+                    destinationPath,
+                ),
+            )
 
-                logging.info(
-                    f"A total of {totalIgnored} words where ignored for the {lang} language"
+    if not __INTERRUPTED__:
+        remove_checkpoint(lang)
+    blacklist.close()
+
+
+def get_chunk_jobs(
+    word_sets_files, destination=None, chunk_size=default_chunk_size, delta=False
+):
+    """
+    Split every set in jobs of about `chunk_size` bytes.
+    Sets with an existing output are skipped (unless computing deltas),
+    as `handle_wordsets` does.
+    """
+    jobs = []
+    for wordSet in word_sets_files:
+        lang = wordSet["lang"]
+        for wordType in ["noun", "adj"]:
+            path = Path(wordSet[wordType]).resolve()
+            if get_output_path(destination, lang, wordType).exists() and not delta:
+                logging.info(f'File "{path.name}" already exists.')
+                continue
+
+            if not path.exists():
+                logging.error(f'File "{path.name}" does not exists in directory')
+                continue
+
+            for index, (start, end) in enumerate(split_file(path, chunk_size)):
+                jobs.append(
+                    {
+                        "lang": lang,
+                        "type": wordType,
+                        "path": fspath(path),
+                        "index": index,
+                        "start": start,
+                        "end": end,
+                        "size": end - start,
+                    }
                 )
 
-            # Prevent abrupt interruption and
-            # allow to save any processed words
-            except KeyboardInterrupt:
-                __INTERRUPTED__ = True
-            finally:
-                save_dictionary(filePath, lang, wordType, words)
+    return jobs
+
+
+def parse_chunk(job: dict):
+    """
+    Pool worker: filter a chunk of a set with its own blacklist.
+    Words blacklisted by the previous chunks are read from the latest
+    snapshot of the blacklist, checked again before every block.
+    Returns the accepted words and the words blacklisted by the chunk.
+    """
+    attach(job["shared"])
+    words = WordStore()
+    blacklist = SharedBlacklist(job["snapshot"])
+    with BlockReader(
+        job["path"],
+        job["start"],
+        job["end"],
+        prefilter=is_line_blacklisted,
+        io_slot=io_slot(),
+    ) as reader:
+        line_number = 1
+        for lines, _ in reader.blocks():
+            blacklist.refresh()
+            parse_lines(job["lang"], lines, words, blacklist, job["path"], line_number)
+            line_number += len(lines)
+        reader.log_metrics(job["path"])
+
+    return job, (list(words), blacklist.words)
+
+
+class ChunkMerge:
+    """
+    Merge the chunks of a language in the same order the sets are parsed
+    (nouns first, then adjectives), as soon as all the previous chunks
+    are done, and save the dictionaries.
+    A word found by a chunk is only kept if none of the previous
+    chunks blacklisted it, just like when the sets are parsed serially.
+    """
+
+    def __init__(
+        self,
+        lang: str,
+        jobs,
+        destination=None,
+        memory_budget=None,
+        shared=None,
+        delta=False,
+    ):
+        self.lang = lang
+        self.destination = destination
+        self.shared = shared
+        self.delta = delta
+        self.order = sorted(
+            (["noun", "adj"].index(job["type"]), job["index"]) for job in jobs
+        )
+        self.results = {}
+        self.merged = 0
+
+        self.budget = MemoryBudget(memory_budget)
+        self.blacklist = WordStore(self.budget)
+        self.words = None
+
+        # * Number of blacklisted words, when the last snapshot was published
+        self.blacklisted = 0
+        self.published = 0
+
+    @property
+    def done(self) -> bool:
+        return self.merged == len(self.order)
+
+    def add(self, job: dict, result):
+        key = (["noun", "adj"].index(job["type"]), job["index"])
+        self.results[key] = result
+
+        merged = self.merged
+        while not self.done and self.order[self.merged] in self.results:
+            key = self.order[self.merged]
+            self.merge(key, self.results.pop(key))
+            self.merged += 1
+
+        if self.done:
+            self.blacklist.close()
+            if self.shared is not None:
+                self.shared.remove_blacklist(self.lang)
+
+        elif self.merged > merged and self.shared is not None:
+            # * The blacklist only has words of chunks before the
+            # * pending ones, so any snapshot is valid for all of them
+            if self.blacklisted > self.published * (1 + snapshot_growth):
+                self.shared.publish_blacklist(self.lang, self.blacklist, self.merged)
+                self.published = self.blacklisted
+
+    def merge(self, key, result):
+        wordType = ["noun", "adj"][key[0]]
+        if self.words is None:
+            self.words = WordStore(self.budget, self.blacklist)
+
+        chunkWords, chunkBlacklist = result
+        for word in chunkWords:
+            if word not in self.blacklist:
+                self.words.add(word)
+        for word in chunkBlacklist:
+            self.blacklist.add(word)
+        self.blacklisted += len(chunkBlacklist)
+
+        # * Save the dictionary after the last chunk of the set
+        last = self.merged + 1 == len(self.order)
+        if last or self.order[self.merged + 1][0] != key[0]:
+            filePath = get_output_path(self.destination, self.lang, wordType)
+            save_dictionary(filePath, self.lang, wordType, self.words, self.delta)
+            self.words.close()
+            self.words = None
+
+
+def pool_wordsets(
+    word_sets_files,
+    destination=None,
+    processes=None,
+    io_limit=None,
+    chunk_size=default_chunk_size,
+    memory_budget=None,
+    delta=False,
+):
+    """
+    Parse all the sets with a process pool, largest chunks first.
+    Chunks of a language are merged as soon as the previous ones are done,
+    and the blacklist of the merged chunks is shared with the workers.
+    """
+    jobs = get_chunk_jobs(word_sets_files, destination, chunk_size, delta)
+    shared = SharedState()
+
+    languages = {}
+    for job in jobs:
+        languages.setdefault(job["lang"], []).append(job)
+        job["shared"] = fspath(shared.directory)
+        job["snapshot"] = fspath(shared.get_snapshot_file(job["lang"]))
+
+    merges = {
+        lang: ChunkMerge(lang, langJobs, destination, memory_budget, shared, delta)
+        for lang, langJobs in languages.items()
+    }
+
+    try:
+        for job, result in run_jobs(parse_chunk, jobs, "parse", processes, io_limit):
+            merges[job["lang"]].add(job, result)
+    finally:
+        shared.close()
 
 
 # Loop through all words
@@ -102,7 +484,71 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     logging.root.setLevel(logging.INFO)
 
-    if word_sets_files is not None:
+    parser = argparse.ArgumentParser(description="Parse the nouns and adjectives sets")
+    parser.add_argument(
+        "--processes",
+        "-p",
+        type=int,
+        default=1,
+        dest="processes",
+        help="Number of processes to parse the sets with (0 to use all CPUs)",
+    )
+    parser.add_argument(
+        "--io-limit",
+        type=int,
+        default=None,
+        dest="io_limit",
+        help="Maximum number of processes reading sets at the same time",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=default_chunk_size // (1024 * 1024),
+        dest="chunk_size",
+        help="Sets bigger than this size (in MB) are split in chunks",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=default_interval // (1024 * 1024),
+        dest="checkpoint_every",
+        help="Save a checkpoint every time this many MB of a set are parsed (0 to disable)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        dest="memory_budget",
+        help="Memory (in MB) for the words of a language, past it words are spilled to disk",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Parse existing dictionaries again and save the words added and removed",
+    )
+    args = parser.parse_args()
+
+    memory_budget = None
+    if args.memory_budget is not None:
+        memory_budget = args.memory_budget * 1024 * 1024
+
+    if word_sets_files is not None and args.processes != 1:
+        processes = args.processes if args.processes > 0 else None
+        elapsed = wallTime()
+        pool_wordsets(
+            word_sets_files,
+            None,
+            processes,
+            args.io_limit,
+            args.chunk_size * 1024 * 1024,
+            memory_budget,
+            args.delta,
+        )
+        logging.info(f"All languages took {wallTime() - elapsed} seconds to complete")
+
+    elif word_sets_files is not None:
+        signal.signal(signal.SIGINT, handle_interrupt)
+
         for wordSet in word_sets_files:
             logging.debug(f"Parsing word set: {wordSet}")
 
@@ -111,10 +557,17 @@ if __name__ == "__main__":
             elapsed = perfTime()
 
             # Handle words sets
-            handle_wordsets(lang, wordSet)
+            handle_wordsets(
+                lang,
+                wordSet,
+                None,
+                memory_budget,
+                args.checkpoint_every * 1024 * 1024,
+                args.delta,
+            )
+            if __INTERRUPTED__:
+                break
+
             logging.info(
                 f"{lang.upper()} language took {perfTime() - elapsed} seconds to complete"
             )
-
-            # Clear words blacklist from the language
-            clear_blacklisted()
@@ -0,0 +1,176 @@
+"""
+Read-ahead reader for .kds sets.
+
+A background thread reads big binary blocks, splits them in lines and runs
+a cheap prefilter on the raw bytes, while the parser consumes the lines
+from a bounded queue. Lines rejected by the prefilter are never decoded.
+"""
+
+import logging
+import queue
+import threading
+from os import fspath
+from time import perf_counter
+
+# Size of every block read from disk
+default_block_size = 4 * 1024 * 1024
+
+# Maximum number of blocks waiting to be parsed
+default_depth = 4
+
+
+class BlockReader:
+    """
+    Iterate the lines (as bytes) of a file between `start` and `end`.
+    Lines rejected by `prefilter` are replaced by None, so line numbers
+    are kept. `offset` is the position after the last line consumed
+    from a finished block, which is always the start of a line.
+    """
+
+    def __init__(
+        self,
+        path,
+        start=0,
+        end=None,
+        prefilter=None,
+        block_size=default_block_size,
+        depth=default_depth,
+        io_slot=None,
+    ):
+        self.path = fspath(path)
+        self.start = start
+        self.end = end
+        self.prefilter = prefilter
+        self.block_size = block_size
+        self.io_slot = io_slot
+        self.offset = start
+
+        self.metrics = {
+            "blocks": 0,
+            "bytes": 0,
+            "lines": 0,
+            "filtered": 0,
+            "max_depth": 0,
+            "total_depth": 0,
+            "read_stall": 0.0,  # Time the reader waited for the parser
+            "parse_stall": 0.0,  # Time the parser waited for the reader
+        }
+
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        for lines, _ in self.blocks():
+            yield from lines
+
+    def blocks(self):
+        """
+        Iterate the (lines, end) of every block, where `end` is
+        the position in the file after the last line of the block
+        """
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+        while True:
+            started = perf_counter()
+            item = self._queue.get()
+            self.metrics["parse_stall"] += perf_counter() - started
+
+            depth = self._queue.qsize()
+            self.metrics["max_depth"] = max(self.metrics["max_depth"], depth)
+            self.metrics["total_depth"] += depth
+
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+
+            lines, end = item
+            yield lines, end
+            self.offset = end
+
+    def _put(self, item) -> bool:
+        started = perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                self.metrics["read_stall"] += perf_counter() - started
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_block(self, f, size):
+        if self.io_slot is None:
+            return f.read(size)
+        with self.io_slot:
+            return f.read(size)
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.start)
+                position = self.start
+                remainder = b""
+
+                while not self._stop.is_set():
+                    size = self.block_size
+                    if self.end is not None:
+                        size = min(size, self.end - position)
+                    block = self._read_block(f, size) if size > 0 else b""
+                    position += len(block)
+
+                    if not block:
+                        # Last line without a newline
+                        if remainder and not self._put(
+                            (self._filter([remainder]), position)
+                        ):
+                            return
+                        break
+
+                    self.metrics["blocks"] += 1
+                    self.metrics["bytes"] += len(block)
+
+                    lines = (remainder + block).split(b"\n")
+                    remainder = lines.pop()
+                    end = position - len(remainder)
+                    if not self._put((self._filter(lines), end)):
+                        return
+
+            self._put(None)
+
+        except Exception as err:
+            self._put(err)
+
+    def _filter(self, lines: list) -> list:
+        self.metrics["lines"] += len(lines)
+        if self.prefilter is None:
+            return lines
+
+        prefilter = self.prefilter
+        filtered = [None if prefilter(line) else line for line in lines]
+        self.metrics["filtered"] += filtered.count(None)
+        return filtered
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def log_metrics(self, name=""):
+        metrics = self.metrics
+        blocks = max(metrics["blocks"], 1)
+        logging.info(
+            f"Read {metrics['bytes']} bytes of {name} in {metrics['blocks']} blocks "
+            f"({metrics['filtered']}/{metrics['lines']} lines prefiltered). "
+            f"Queue depth: {metrics['total_depth'] / blocks:.1f} avg, "
+            f"{metrics['max_depth']} max. Stalls: "
+            f"reader {metrics['read_stall']:.2f}s, parser {metrics['parse_stall']:.2f}s"
+        )
@@ -0,0 +1,227 @@
+"""
+Filter state shared with the workers of a process pool.
+
+The parent publishes memory-mapped files that workers read in place,
+without pickling them per task:
+- A bitmap of the codepoints blacklisted by `__blacklisted_characters__re`,
+  cached across runs, checked instead of matching the regex on every word.
+- Snapshots of the blacklist of every language, replaced as chunks are
+  merged, so workers can skip the words previous chunks blacklisted.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+from array import array
+from os import fspath
+from pathlib import Path
+
+import filters
+from filters import __blacklisted_characters__re
+
+# Folder where the shared files are published
+shared_path = Path(".cache") / "shared"
+
+# Number of codepoints in Unicode
+codepoints = 0x110000
+
+# Publish a new blacklist snapshot once it grew by this fraction
+snapshot_growth = 0.25
+
+# Header of a table: number of entries and position of the offsets
+table_header = struct.Struct("<QQ")
+
+# * Files mapped by this process, by path
+__mapped__ = {}
+
+
+def get_codepoints_file() -> Path:
+    """The bitmap file of the current regex, as it may change between runs"""
+    pattern = __blacklisted_characters__re
+    key = f"{pattern.flags}:{pattern.pattern}".encode("utf-8")
+    digest = hashlib.sha1(key).hexdigest()[:16]
+    return Path(shared_path / f"codepoints-{digest}.bin").resolve()
+
+
+def build_codepoint_bitmap() -> bytearray:
+    """
+    Check every codepoint with the regex, as `has_blacklisted_unicode` does.
+    The regex only matches the first character of a word, so the bit of
+    that character tells if the word has a blacklisted unicode character.
+    """
+    bitmap = bytearray(codepoints // 8)
+    for codepoint in range(codepoints):
+        if __blacklisted_characters__re.match(re.escape(chr(codepoint))):
+            bitmap[codepoint >> 3] |= 1 << (codepoint & 7)
+    return bitmap
+
+
+def get_snapshot_file(directory, lang: str) -> Path:
+    return Path(directory) / f"{lang}.blacklist.bin"
+
+
+def publish_file(path: Path, chunks):
+    """Write a shared file, replacing the previous one only once it's written"""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    temporary = path.with_name(f"{path.name}.tmp")
+    with open(temporary, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temporary, path)
+
+
+def map_file(path) -> mmap.mmap:
+    """
+    Map a shared file (read only), once per process. A replaced file
+    is mapped again, the previous mapping is kept by its readers.
+    """
+    path = fspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    mapped = __mapped__.get(path)
+    if mapped is None or mapped[0] != signature:
+        with open(path, "rb") as f:
+            mapped = (signature, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        __mapped__[path] = mapped
+
+    return mapped[1]
+
+
+def pack_table(words):
+    """
+    Pack words (sorted by codepoint) in a table: the header, the UTF-8 of
+    every word and the offset of each one. Yields the bytes to write.
+    """
+    offsets = array("Q", [table_header.size])
+    data = []
+    for word in words:
+        encoded = word.encode("utf-8", "surrogatepass")
+        data.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+
+    yield table_header.pack(len(data), offsets[-1])
+    yield from data
+    yield offsets.tobytes()
+
+
+class SortedTable:
+    """
+    Read only view of a packed table. Words are compared by their
+    UTF-8, which sorts in the same order as their codepoints.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.count, start = table_header.unpack_from(buffer)
+        self.offsets = memoryview(buffer)[start:].cast("Q")
+
+    def __len__(self):
+        return self.count
+
+    def _get(self, index: int) -> bytes:
+        return self.buffer[self.offsets[index] : self.offsets[index + 1]]
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self._get(index).decode("utf-8", "surrogatepass")
+
+    def index(self, word: str) -> int:
+        """The position of the word in the table, -1 if missing"""
+        try:
+            encoded = word.encode("utf-8", "surrogatepass")
+        except UnicodeEncodeError:
+            return -1
+
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self._get(low) == encoded:
+            return low
+        return -1
+
+    def __contains__(self, word) -> bool:
+        return self.index(word) >= 0
+
+
+class SharedBlacklist:
+    """
+    Blacklist of a worker: the words it blacklists are kept in its own set,
+    and the words blacklisted by the previous chunks are read from the
+    latest snapshot, checked again every time `refresh` is called.
+    """
+
+    def __init__(self, snapshot=None):
+        self.words = set()
+        self.snapshot = snapshot
+        self.previous = None
+
+    def refresh(self):
+        if self.snapshot is None or not os.path.exists(self.snapshot):
+            return
+        self.previous = SortedTable(map_file(self.snapshot))
+
+    def add(self, word):
+        self.words.add(word)
+
+    def __contains__(self, word) -> bool:
+        if word in self.words:
+            return True
+        return self.previous is not None and word in self.previous
+
+    def __iter__(self):
+        return iter(self.words)
+
+
+class SharedState:
+    """
+    Files published by the parent for a single run of a pool.
+    Only the directory is sent to the workers.
+    """
+
+    def __init__(self, directory=shared_path):
+        Path(directory).mkdir(exist_ok=True, parents=True)
+        self.directory = Path(tempfile.mkdtemp(dir=directory))
+
+        codepoints_file = get_codepoints_file()
+        if not codepoints_file.exists():
+            logging.info("Building the bitmap of blacklisted codepoints...")
+            publish_file(codepoints_file, [build_codepoint_bitmap()])
+        shutil.copyfile(codepoints_file, self.directory / "codepoints.bin")
+
+    def get_snapshot_file(self, lang: str) -> Path:
+        return get_snapshot_file(self.directory, lang)
+
+    def publish_blacklist(self, lang: str, blacklist, chunk: int):
+        """
+        Publish a snapshot of the blacklist of a language, made of the
+        words blacklisted by every chunk before `chunk` (in merge order).
+        """
+        words = (word for word, _ in blacklist.iter_first())
+        publish_file(self.get_snapshot_file(lang), pack_table(words))
+        logging.debug(f"Published blacklist of {lang} up to chunk {chunk}")
+
+    def remove_blacklist(self, lang: str):
+        path = self.get_snapshot_file(lang)
+        if path.exists():
+            path.unlink()
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def attach(directory):
+    """Use the published codepoints bitmap in this process, instead of the regex"""
+    directory = Path(directory)
+    filters.__blacklisted_codepoints__ = map_file(directory / "codepoints.bin")
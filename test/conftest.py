@@ -0,0 +1,61 @@
+import importlib
+import json
+import random
+
+import pytest
+from wordfreq import top_n_list
+
+tags = [[], [], [], ["obsolete"], ["abbreviation"], ["noun-from-verb"]]
+
+
+def write_set(path, words, pos, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        for word in words:
+            data = {"pos": pos, "word": word, "senses": [{"tags": rng.choice(tags)}]}
+            if rng.random() < 0.1:
+                data["synonyms"] = [{"word": rng.choice(words)}]
+            if rng.random() < 0.1:
+                data["forms"] = [{"form": rng.choice(words), "tags": rng.choice(tags)}]
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+
+@pytest.fixture
+def sets(tmp_path, monkeypatch):
+    """A tiny english set, with the current folder moved next to it"""
+    rng = random.Random(0)
+    words = [word for word in top_n_list("en", 3000) if word.isalpha()]
+
+    directory = tmp_path / "sets"
+    directory.mkdir()
+    wordSet = {
+        "lang": "en",
+        "noun": str(directory / "en_nouns.kds"),
+        "adj": str(directory / "en_adj.kds"),
+    }
+    write_set(wordSet["noun"], rng.sample(words, 1500), "noun", rng)
+    write_set(wordSet["adj"], rng.sample(words, 1500), "adj", rng)
+    with open(directory / "wordsets.json", "w", encoding="utf-8") as f:
+        json.dump([wordSet], f)
+
+    # * parse_data reads the wordsets of the current folder when imported
+    monkeypatch.chdir(tmp_path)
+    return [wordSet]
+
+
+@pytest.fixture
+def parse_data(sets):
+    return importlib.import_module("parse_data")
+
+
+@pytest.fixture
+def serial(tmp_path, sets, parse_data):
+    """Dictionaries of the sets parsed serially, in memory"""
+    for wordSet in sets:
+        parse_data.handle_wordsets(wordSet["lang"], wordSet, "serial")
+
+    assert len(read_dictionaries(tmp_path / "serial")) == 2 * len(sets)
+    return tmp_path / "serial"
+
+
+def read_dictionaries(directory) -> dict:
+    return {path.name: path.read_bytes() for path in directory.glob("*.json")}
@@ -0,0 +1,83 @@
+import shutil
+from functools import partial
+
+import pytest
+from conftest import read_dictionaries
+
+import reader
+from checkpoint import get_checkpoint_file
+
+# Small enough for every set to be read in many blocks and checkpoints
+block_size = 1024
+checkpoint_interval = 2 * 1024
+
+
+class Killed(Exception):
+    pass
+
+
+@pytest.fixture
+def kill(parse_data, monkeypatch):
+    """
+    Make the next parse stop (as if killed) once it read `blocks` blocks,
+    or never with None
+    """
+    monkeypatch.setattr(
+        parse_data, "BlockReader", partial(reader.BlockReader, block_size=block_size)
+    )
+    parse_lines = parse_data.parse_lines
+    limit = {"blocks": None, "calls": 0}
+
+    def parse_until_killed(*args):
+        limit["calls"] += 1
+        if limit["blocks"] is not None and limit["calls"] > limit["blocks"]:
+            raise Killed
+        return parse_lines(*args)
+
+    def kill(blocks):
+        limit["blocks"] = blocks
+        limit["calls"] = 0
+
+    monkeypatch.setattr(parse_data, "parse_lines", parse_until_killed)
+    return kill
+
+
+def parse(parse_data, sets, destination, memory_budget=None):
+    for wordSet in sets:
+        parse_data.handle_wordsets(
+            wordSet["lang"], wordSet, destination, memory_budget, checkpoint_interval
+        )
+
+
+@pytest.mark.parametrize("memory_budget", [None, 2 * 1024])
+@pytest.mark.parametrize("blocks", [30, 130])
+def test_killed_parse_resumes(
+    tmp_path, sets, parse_data, serial, kill, memory_budget, blocks
+):
+    kill(blocks)
+    with pytest.raises(Killed):
+        parse(parse_data, sets, "resumed", memory_budget)
+    assert get_checkpoint_file("en").exists()
+
+    kill(None)
+    parse(parse_data, sets, "resumed", memory_budget)
+    assert read_dictionaries(tmp_path / "resumed") == read_dictionaries(serial)
+    assert not get_checkpoint_file("en").exists()
+
+
+def test_checkpoint_of_saved_set_is_ignored(tmp_path, sets, parse_data, serial, kill):
+    kill(30)
+    with pytest.raises(Killed):
+        parse(parse_data, sets, "resumed", 2 * 1024)
+
+    # * The nouns were saved meanwhile, as by a pool
+    for destination in ["resumed", "fresh"]:
+        (tmp_path / destination).mkdir()
+        shutil.copy(serial / "en_noun.json", tmp_path / destination)
+
+    kill(None)
+    parse(parse_data, sets, "resumed", 2 * 1024)
+    parse(parse_data, sets, "fresh", 2 * 1024)
+    assert read_dictionaries(tmp_path / "resumed") == read_dictionaries(
+        tmp_path / "fresh"
+    )
@@ -0,0 +1,27 @@
+import hashlib
+import json
+
+
+def test_delta_against_previous_dictionary(tmp_path, sets, parse_data, serial):
+    words = json.loads((serial / "en_noun.json").read_text(encoding="utf-8"))
+
+    # * Previous version with some words that are not parsed anymore
+    previous = words[::2] + ["previousword", "älterwort"]
+    path = tmp_path / "dict" / "en_noun.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps(previous, ensure_ascii=False, indent=2), "utf-8")
+    previousHash = hashlib.sha256(path.read_bytes()).hexdigest()
+
+    for wordSet in sets:
+        parse_data.handle_wordsets(wordSet["lang"], wordSet, None, delta=True)
+
+    assert path.read_bytes() == (serial / "en_noun.json").read_bytes()
+    delta = json.loads(parse_data.get_delta_path(path).read_text(encoding="utf-8"))
+    assert delta["lang"] == "en" and delta["type"] == "noun"
+    assert delta["from"] == previousHash
+    assert delta["to"] == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert delta["added"] == sorted(set(words) - set(previous))
+    assert delta["removed"] == sorted(set(previous) - set(words))
+
+    # * Without a previous version, no delta is saved
+    assert not parse_data.get_delta_path(tmp_path / "dict" / "en_adj.json").exists()
@@ -0,0 +1,73 @@
+import importlib
+
+import pytest
+from conftest import read_dictionaries
+
+# Small enough for every set to be split in many shards
+chunk_size = 4 * 1024
+
+
+@pytest.fixture
+def distributed(sets, monkeypatch):
+    distributed = importlib.import_module("distributed")
+    monkeypatch.setattr(distributed, "poll_interval", 0.05)
+    return distributed
+
+
+@pytest.fixture
+def failed_queue(tmp_path, sets, distributed, monkeypatch):
+    """
+    Queue of a coordinator that stopped because its adjectives failed,
+    published by another coordinator that died before
+    """
+    queue = tmp_path / "queue"
+    jobs = distributed.get_chunk_jobs(sets, None, chunk_size)
+    signature = distributed.get_sets_signature(sets, chunk_size)
+    distributed.publish_shards(queue, jobs, tmp_path / "deleted", signature)
+
+    parse_chunk = distributed.parse_chunk
+
+    def parse_nouns(job):
+        if job["type"] == "adj":
+            raise OSError("Cannot read the adjectives")
+        return parse_chunk(job)
+
+    # * Local workers are forked, so they parse with it too
+    with monkeypatch.context() as patch:
+        patch.setattr(distributed, "parse_chunk", parse_nouns)
+        assert not distributed.run_coordinator(queue, sets, chunk_size, workers=2)
+
+    conn = distributed.connect(queue)
+    states = distributed.count_states(conn)
+    conn.close()
+    assert states.get("failed") and states.get("done")
+    return queue
+
+
+def test_local_workers_match_serial_parse(tmp_path, sets, serial, distributed):
+    queue = tmp_path / "queue"
+    assert distributed.run_coordinator(queue, sets, chunk_size, workers=2)
+    assert read_dictionaries(tmp_path / "dict") == read_dictionaries(serial)
+    assert not distributed.get_queue_file(queue).exists()
+
+
+def test_failed_shards_are_resumed(tmp_path, sets, serial, distributed, failed_queue):
+    assert distributed.run_coordinator(failed_queue, sets, chunk_size, workers=2)
+    assert read_dictionaries(tmp_path / "dict") == read_dictionaries(serial)
+
+
+def test_changed_sets_are_not_resumed(
+    tmp_path, sets, parse_data, distributed, failed_queue
+):
+    # * Every line moves, so the shards already done don't match anymore
+    for wordSet in sets:
+        with open(wordSet["noun"], "r+", encoding="utf-8") as f:
+            lines = f.readlines()
+            f.seek(0)
+            f.writelines(lines[::-1])
+        parse_data.handle_wordsets(wordSet["lang"], wordSet, "serial")
+
+    assert distributed.run_coordinator(failed_queue, sets, chunk_size, workers=2)
+    assert read_dictionaries(tmp_path / "dict") == read_dictionaries(
+        tmp_path / "serial"
+    )
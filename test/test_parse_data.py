@@ -0,0 +1,27 @@
+from conftest import read_dictionaries
+
+# Small enough for every set to be split in many chunks
+chunk_size = 4 * 1024
+
+
+def test_memory_budget_matches_in_memory_parse(
+    tmp_path, sets, parse_data, serial, monkeypatch
+):
+    spills = []
+    spill = parse_data.WordStore.spill
+
+    def count_spill(store):
+        spills.append(store)
+        spill(store)
+
+    monkeypatch.setattr(parse_data.WordStore, "spill", count_spill)
+    for wordSet in sets:
+        parse_data.handle_wordsets(wordSet["lang"], wordSet, "budget", 2 * 1024)
+
+    assert spills
+    assert read_dictionaries(tmp_path / "budget") == read_dictionaries(serial)
+
+
+def test_pool_matches_serial_parse(tmp_path, sets, parse_data, serial):
+    parse_data.pool_wordsets(sets, "pool", 2, None, chunk_size)
+    assert read_dictionaries(tmp_path / "pool") == read_dictionaries(serial)
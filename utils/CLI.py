@@ -2,10 +2,14 @@
 
 import argparse
 import logging
-import multiprocessing
-import sys
 
-from fetch_sets import fetch_set, get_supported_languages
+from fetch_sets import (
+    fetch_set,
+    get_language_sizes,
+    get_supported_languages,
+    load_catalog,
+)
+from scheduler import run_jobs
 
 # New parser
 parser = argparse.ArgumentParser(
@@ -41,21 +45,12 @@ optional.add_argument(
 )
 
 
-# Little trick to bypass the required attribute error
-class langAction(argparse.Action):
-    def __call__(self, parser, namespace, values, option_string):
-        print("Supported Languages:")
-        for lang in get_supported_languages():
-            print(f"* {lang['name']}")
-        # To avoid the required arguments error, we immediately exit
-        sys.exit(0)
-
-
 optional.add_argument(
     "-s",
     "--supported-languages",
-    nargs="?",
-    action=langAction,
+    action="store_true",
+    default=False,
+    dest="supported",
     help="Show all supported languages in the dictionary",
 )
 
@@ -68,7 +63,7 @@ required.add_argument(
     "-lang",
     nargs="+",
     type=str,
-    required=True,
+    default=None,
     dest="languages",
     help="Language/s code names (separated with spaces)",
 )
@@ -97,6 +92,27 @@ optional.add_argument(
     dest="threadnum",
     help="Number of threads to use",
 )
+optional.add_argument(
+    "--io-limit",
+    type=int,
+    default=None,
+    dest="iolimit",
+    help="Maximum number of simultaneous downloads (by default, one per thread)",
+)
+optional.add_argument(
+    "--offline",
+    action=argparse.BooleanOptionalAction,
+    default=False,
+    dest="offline",
+    help="Only use the cached catalog of languages, never download the index",
+)
+optional.add_argument(
+    "--refresh-catalog",
+    action="store_true",
+    default=False,
+    dest="refresh",
+    help="Download the catalog of languages even if the cached one is still valid",
+)
 optional.add_argument(
     "-d",
     "--debug",
@@ -123,13 +139,29 @@ args = parser.parse_args()
 # Set log level (Warning by default)
 logging.basicConfig(level=args.loglevel)
 
+# The languages are only required when not listing the supported ones,
+# which is done after parsing so the catalog follows --offline
+if not args.supported and not args.languages:
+    parser.error("the following arguments are required: --language/-lang")
 
-def funcWrapper(lang):
-    fetch_set(lang, args.destination)
+
+def funcWrapper(job):
+    # The catalog was already cached by the main process
+    load_catalog(offline=True)
+    fetch_set(job["lang"], args.destination)
+    return job, None
 
 
 if __name__ == "__main__":
-    if not args.multithread:
+    # Load the catalog once, so every language (and worker) can reuse it
+    load_catalog(args.offline, args.refresh)
+
+    if args.supported:
+        print("Supported Languages:")
+        for lang in get_supported_languages(args.offline):
+            print(f"* {lang['name']}")
+
+    elif not args.multithread:
         for language in args.languages:
             fetch_set(language, args.destination)
 
@@ -138,7 +170,12 @@ if __name__ == "__main__":
         if threads <= 0:
             threads = None
 
+        # Download the biggest languages first
+        sizes = get_language_sizes(args.languages, args.offline)
+        jobs = [{"lang": lang, "size": sizes[lang]} for lang in args.languages]
+
         logging.debug("Starting pooling")
-        with multiprocessing.Pool(processes=threads) as pool:
-            for result in pool.imap_unordered(funcWrapper, args.languages):
-                pass
+        for job, result in run_jobs(
+            funcWrapper, jobs, "download", threads, args.iolimit
+        ):
+            logging.debug(f"Finished downloading {job['lang']}")
@@ -0,0 +1,87 @@
+"""
+Benchmark of the tokenization check of `is_word_used`, per language.
+
+Compares tokenizing every word (as it was done before) with the cheap
+pre-check and the cached tokenization, over the words of every set
+listed in wordsets.json, and checks that both give the same results.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+from time import perf_counter
+
+# Make the util directory root if not already
+os.chdir(Path(__file__).parents[0].resolve())
+
+# Add parent folder to path so we can import filters
+sys.path.append("..")
+
+from wordfreq import tokenize
+
+from filters import count_tokens, is_tokenized_too_long, is_word_malformed
+
+
+def get_words(kds_set_file) -> list[str]:
+    """All the words of a set that would be tokenized (duplicates included)"""
+    words = []
+    with open(f"{kds_set_file}", "rb") as f:
+        for line in f:
+            try:
+                word = json.loads(line)["word"].lower()
+            except (json.JSONDecodeError, KeyError):
+                continue
+            if not is_word_malformed(word):
+                words.append(word)
+    return words
+
+
+def bench_language(lang: str, words: list[str]) -> dict:
+    started = perf_counter()
+    before = [len(tokenize(word, lang)) > 2 for word in words]
+    before_time = perf_counter() - started
+
+    count_tokens.cache_clear()
+    started = perf_counter()
+    after = [is_tokenized_too_long(word, lang) for word in words]
+    after_time = perf_counter() - started
+
+    tokenized = count_tokens.cache_info().currsize
+    return {
+        "lang": lang,
+        "words": len(words),
+        "tokenized": tokenized,
+        "before": before_time,
+        "after": after_time,
+        "same": before == after,
+    }
+
+
+if __name__ == "__main__":
+    wordsets_json_path = Path("../sets/wordsets.json").resolve()
+    if not wordsets_json_path.exists():
+        print(
+            """No wordsets.json file found,
+            please run build_data.py before executing this script"""
+        )
+        sys.exit(1)
+
+    with open(wordsets_json_path, mode="r", encoding="utf-8") as f:
+        wordsets = json.load(f)
+
+    print("lang\twords\ttokenized\tbefore (s)\tafter (s)\tspeedup\tsame")
+    for set in wordsets:
+        words = []
+        for kds_set in [set["noun"], set["adj"]]:
+            kds_set_file = Path(kds_set).resolve()
+            if kds_set_file.exists():
+                words += get_words(kds_set_file)
+
+        result = bench_language(set["lang"], words)
+        speedup = result["before"] / max(result["after"], 1e-9)
+        print(
+            f"{result['lang']}\t{result['words']}\t{result['tokenized']}\t"
+            f"{result['before']:.3f}\t{result['after']:.3f}\t"
+            f"{speedup:.1f}x\t{result['same']}"
+        )
@@ -1,50 +1,219 @@
 #!/usr/bin/env python
 
+import codecs
+import json
 import logging
-import sys
+import re
+import time
 import urllib.error
 import urllib.parse
 import urllib.request
+from functools import lru_cache
+from html.parser import HTMLParser
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 
-import pycountry
-from bs4 import BeautifulSoup, SoupStrainer
+from scheduler import get_remote_size, io_slot
 
 languages_url = "https://kaikki.org/dictionary/index.html"
-try:
-    urllib.request.urlopen(languages_url)
 
-except urllib.request.HTTPError as err:
-    logging.critical("Cannot get document of all available languages on Kaikki")
-    logging.exception(err)
-    sys.exit(0)
+# * The catalog of supported languages is cached locally so the CLI and every
+# * pool worker can resolve languages without downloading the index again
+catalog_path = Path(".cache") / "catalog.json"
+catalog_ttl = 7 * 24 * 60 * 60  # One week, in seconds
+
+# Size of the chunks streamed from the index page into the parser
+chunk_size = 64 * 1024
+
+# Rough size (in bytes) of a sense in the sets, to estimate the size of a
+# language from the number of senses in the catalog without requesting it
+bytes_per_sense = 2 * 1024
+
+# Maximum number of sizes requested at the same time
+size_requests = 16
+
+
+class LanguageIndexParser(HTMLParser):
+    """
+    Minimal streaming parser for Kaikki's index page.
+    Only the anchors inside <li> tags are collected.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.anchors: list[tuple[str, str]] = []
+        self._depth = 0
+        self._href = None
+        self._text: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "li":
+            self._depth += 1
+        elif tag == "a" and self._depth:
+            self._href = dict(attrs).get("href")
+            self._text = []
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._href is not None:
+            self.anchors.append((self._href, "".join(self._text)))
+            self._href = None
+        elif tag == "li" and self._depth:
+            self._depth -= 1
+
+
+def resolve_code(name: str):
+    """
+    Get the ISO 639-1 code of a language name using pycountry,
+    or None when the language has no two letter code.
+    """
+    # Pycountry loads its whole database on first use, import it only when needed
+    import pycountry
+
+    language = pycountry.languages.get(name=name)
+    return getattr(language, "alpha_2", None)
+
+
+def normalize_code(name: str) -> str:
+    return name.lower().replace("_", "")
+
+
+def parse_language_index(response) -> list[dict]:
+    """
+    Stream the index page through the parser and
+    build the catalog entries for every language listed
+    """
+    parser = LanguageIndexParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while chunk := response.read(chunk_size):
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+
+    base_url = languages_url.replace("index.html", "")
+    catalog = []
+    for href, text in parser.anchors:
+        if not href or href == "#" or "./" in href or "combined" in href:
+            continue
+
+        lang_name = re.sub(r"(\s?\(.+?\))", "", text).replace(" ", "_")
+        senses = re.search(r"\((\d+) senses?\)", text)
+        catalog.append(
+            {
+                "name": lang_name,
+                "slug": href.split("/", 1)[0],
+                "link": f"{base_url}{href}",
+                "code": resolve_code(lang_name) or normalize_code(lang_name),
+                "senses": int(senses.group(1)) if senses else None,
+                "sizes": {},
+            }
+        )
+
+    return catalog
+
+
+def save_catalog(catalog: list[dict], updated=None):
+    """Cache the catalog. `updated` is when it was downloaded, by default now"""
+    if not catalog:
+        logging.warning("The catalog has no languages, it won't be cached")
+        return
+
+    catalog_path.parent.mkdir(exist_ok=True, parents=True)
+    data = {"updated": updated or time.time(), "languages": catalog}
+    with open(catalog_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, ensure_ascii=False, indent=2))
+
+
+# * Catalog loaded by this process
+__catalog__ = None
+
+
+def read_catalog():
+    if not catalog_path.exists():
+        return None
+
+    try:
+        with open(catalog_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        logging.warning(f'Ignoring unreadable catalog "{catalog_path}"')
+        return None
+
+
+def load_catalog(offline=False, refresh=False) -> list[dict]:
+    """
+    Get the catalog of all languages available on Kaikki.
+    The cached catalog is used while it's younger than `catalog_ttl`,
+    or whenever the index can't be downloaded (or `offline` is set).
+    Once loaded, the catalog is kept in memory for the rest of the process.
+    """
+    global __catalog__
+
+    if __catalog__ is not None and not refresh:
+        return __catalog__
+
+    __catalog__ = fetch_catalog(offline, refresh)
+    get_catalog_index.cache_clear()
+    return __catalog__
+
+
+def fetch_catalog(offline=False, refresh=False) -> list[dict]:
+    cached = read_catalog()
+    is_fresh = cached and time.time() - cached["updated"] < catalog_ttl
+
+    if cached and (offline or (is_fresh and not refresh)):
+        logging.debug(f'Using cached catalog from "{catalog_path}"')
+        return cached["languages"]
+
+    if offline:
+        logging.critical("No cached catalog found and offline mode is enabled")
+        return []
+
+    logging.info("Downloading the list of all available languages on Kaikki...")
+    try:
+        with urllib.request.urlopen(languages_url) as r:
+            catalog = parse_language_index(r)
+
+    except urllib.error.URLError as err:
+        logging.exception(err)
+        if cached:
+            logging.warning("Cannot update the catalog, the cached one will be used")
+            return cached["languages"]
+
+        logging.critical("Cannot get document of all available languages on Kaikki")
+        return []
+
+    save_catalog(catalog)
+    return catalog
+
+
+@lru_cache(maxsize=None)
+def get_catalog_index() -> dict:
+    """Map the lowercased name of every language to its catalog entry"""
+    return {entry["name"].lower(): entry for entry in load_catalog()}
+
+
+def get_language_code(lang: str) -> str:
+    """
+    Resolve the code used to name the sets of a language.
+    Languages in the catalog are resolved without loading pycountry.
+    """
+    entry = get_catalog_index().get(lang.strip().lower())
+    if entry is not None:
+        return entry["code"]
 
+    code = resolve_code(lang)
+    if not code:
+        logging.warning("No country code found. The name will be used instead.")
+        code = normalize_code(lang)
+    return code
 
-def get_supported_languages():
-    import re
-
-    r = urllib.request.urlopen(languages_url)
-    htmlContent = r.read()
-
-    only_li_tags = SoupStrainer("li")
-    soup = BeautifulSoup(htmlContent, "html.parser", parse_only=only_li_tags)
-
-    anchors = soup.find_all("a")
-
-    supported_languages = []
-    for link in anchors:
-        href = link.get("href")
-        if href != "#" and "./" not in href and "combined" not in href:
-            lang_name = re.sub(r"(\s?\(.+?\))", "", link.contents[0])
-            lang_link = f"{languages_url.replace('index.html', '')}{href}"
-            supported_languages.append(
-                {
-                    "name": lang_name.replace(" ", "_"),
-                    "link": lang_link,
-                }
-            )
 
-    return supported_languages
+def get_supported_languages(offline=False):
+    return load_catalog(offline)
 
 
 def file_retrieve(url, dest) -> bool:
@@ -62,7 +231,8 @@ def file_retrieve(url, dest) -> bool:
             logging.debug(f"Download retries: {retry}")
 
             try:
-                urllib.request.urlretrieve(url, filename=dest)
+                with io_slot():
+                    urllib.request.urlretrieve(url, filename=dest)
                 # If we arrive here, the download was successful
                 return True
 
@@ -87,6 +257,88 @@ def file_retrieve(url, dest) -> bool:
     return False
 
 
+def get_set_urls(lang: str) -> tuple[str, str]:
+    """Get the URLs of the nouns and adjectives sets of a language"""
+    entry = get_catalog_index().get(lang.strip().lower())
+    if entry is not None and entry.get("slug"):
+        # * The folder of the language in the index, as Kaikki names it
+        lang = urllib.parse.unquote(entry["slug"])
+    else:
+        # Normalize language if needed
+        # Since CLI doesn't support spaced languages, underscores are treated as spaces
+        lang = lang.strip().title().replace("_", " ")
+
+    # * Note: this files are JSON format for convenience but will fail to parse because
+    # * every line inside of them corresponds to a JSON document.
+    # eg. https://kaikki.org/dictionary/English/by-pos/adj/kaikki.org-dictionary-English-by-pos-adj.json
+    # * The fist language is spaced
+    urlLang = lang.replace(" ", "%20")
+    # * Kaikki uses Pascalcase without spaces for file names
+    urlFile = lang.replace(" ", "")
+    noun = f"https://kaikki.org/dictionary/{urlLang}/by-pos-adj/kaikki_dot_org-dictionary-{urlFile}-by-pos-adj.json"
+    adj = f"https://kaikki.org/dictionary/{urlLang}/by-pos-noun/kaikki_dot_org-dictionary-{urlFile}-by-pos-noun.json"
+
+    return noun, adj
+
+
+def get_cached_size(lang: str):
+    """
+    Get the size (in bytes) of both sets of a language from the catalog:
+    the size saved after requesting it, or an estimation from its number
+    of senses. None if the catalog has neither of them.
+    """
+    entry = get_catalog_index().get(lang.strip().lower())
+    if entry is None:
+        return None
+    if entry["sizes"]:
+        return sum(entry["sizes"].values())
+    if entry["senses"]:
+        return entry["senses"] * bytes_per_sense
+    return None
+
+
+def get_remote_sizes(lang: str) -> dict:
+    noun, adj = get_set_urls(lang)
+    return {"noun": get_remote_size(noun), "adj": get_remote_size(adj)}
+
+
+def get_language_sizes(languages, offline=False) -> dict:
+    """
+    Get the size (in bytes) of both sets of every language. Only the
+    languages without a size in the catalog are requested, all at the
+    same time, and their sizes are saved in the catalog.
+    """
+    sizes = {}
+    missing = []
+    for lang in languages:
+        size = get_cached_size(lang)
+        if size is None:
+            missing.append(lang)
+        else:
+            sizes[lang] = size
+
+    if not missing or offline:
+        return {**sizes, **{lang: 0 for lang in missing}}
+
+    with ThreadPool(min(len(missing), size_requests)) as pool:
+        remote = pool.map(get_remote_sizes, missing)
+
+    found = False
+    for lang, langSizes in zip(missing, remote):
+        sizes[lang] = sum(langSizes.values())
+        entry = get_catalog_index().get(lang.strip().lower())
+        if entry is not None and all(langSizes.values()):
+            entry["sizes"] = langSizes
+            found = True
+
+    # * Saved with the time it was downloaded, so it still expires on time
+    if found:
+        cached = read_catalog()
+        save_catalog(load_catalog(), cached["updated"] if cached else None)
+
+    return sizes
+
+
 def downloadLanguageSets(lang: str, dest=None):
     extension = ".kds"  # Stands for Kaikki Dictionary Set
 
@@ -101,30 +353,14 @@ def downloadLanguageSets(lang: str, dest=None):
     # Create folder if does not exists
     dest.mkdir(exist_ok=True, parents=True)
 
-    countryCode = pycountry.languages.get(name=lang)
-    if not countryCode:
-        logging.warning("No country code found. The name will be used instead.")
-        countryCode = lang.lower().replace("_", "")
-    else:
-        countryCode = countryCode.alpha_2
+    countryCode = get_language_code(lang)
     logging.debug(f'Country code for "{lang}" is "{countryCode}"')
 
-    # Normalize language if needed
-    # Since CLI doesn't support spaced languages, underscores are treated as spaces
-    lang = lang.strip().title().replace("_", " ")
-
     noun_dest = Path(dest / f"{countryCode}_nouns{extension}").resolve()
     adj_dest = Path(dest / f"{countryCode}_adj{extension}").resolve()
 
-    # * Note: this files are JSON format for convenience but will fail to parse because
-    # * every line inside of them corresponds to a JSON document.
-    # eg. https://kaikki.org/dictionary/English/by-pos/adj/kaikki.org-dictionary-English-by-pos-adj.json
-    # * The fist language is spaced
-    urlLang = lang.replace(" ", "%20")
-    # * Kaikki uses Pascalcase without spaces for file names
-    urlFile = lang.replace(" ", "")
-    noun = f"https://kaikki.org/dictionary/{urlLang}/by-pos-adj/kaikki_dot_org-dictionary-{urlFile}-by-pos-adj.json"
-    adj = f"https://kaikki.org/dictionary/{urlLang}/by-pos-noun/kaikki_dot_org-dictionary-{urlFile}-by-pos-noun.json"
+    noun, adj = get_set_urls(lang)
+    lang = lang.strip().title().replace("_", " ")
 
     nouns_success = file_retrieve(noun, noun_dest)
     adj_success = file_retrieve(adj, adj_dest)
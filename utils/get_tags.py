@@ -1,19 +1,37 @@
 """
 Utility to extract all tags from a given .kds file
+
+Besides the list of tags, a census with the number of words of every tag
+(per language and part of speech) is saved, along with how many words
+each blacklisted tag removes. Sets are read in parallel and the results
+of every set are cached, so only new or changed sets are read again
+(or every set, once the blacklisted tags or characters change).
 """
 
+import csv
+import hashlib
+import inspect
 import json
+import multiprocessing
 import os
 import sys
+from collections import Counter
+from os import fspath
 from pathlib import Path
 
 # Make the util directory root if not already
 os.chdir(Path(__file__).parents[0].resolve())
 
-# Add parent folder to path so we can import filters
+# Add parent folder to path so we can import filters and checkpoint
 sys.path.append("..")
 
-from filters import get_word_tags
+from checkpoint import file_signature
+from filters import (
+    __blacklisted_characters__,
+    __blacklisted_tags__,
+    get_word_tags,
+    is_word_malformed,
+)
 
 # Global variable to save all tags found
 tags_found = set()
@@ -42,6 +60,42 @@ def load_last_tags(extracted_tags_file):
             tags_found.add(line.strip("\n"))
 
 
+def census_tags(kds_set_file) -> dict:
+    """
+    Count the words of every tag in a set. Also count the words each
+    blacklisted tag removes, and the ones removed only by that tag
+    (the words that would be kept if the tag was not blacklisted).
+    """
+    tags = Counter()
+    removed = Counter()
+    only = Counter()
+    total = 0
+
+    with open(f"{kds_set_file}", "rb") as f:
+        # every line is a JSON object
+        for line_number, line in enumerate(f, 1):
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Error parsing {kds_set_file.name} at line {line_number}")
+                continue
+
+            total += 1
+            word_tags = get_word_tags(data=data)
+            tags.update(word_tags)
+
+            # Tags are only checked for words that are not malformed
+            if is_word_malformed(data["word"].lower()):
+                continue
+
+            blacklisted = [tag for tag in __blacklisted_tags__ if tag in word_tags]
+            removed.update(blacklisted)
+            if len(blacklisted) == 1:
+                only.update(blacklisted)
+
+    return {"words": total, "tags": tags, "removed": removed, "only": only}
+
+
 def extract_tags(kds_set_file):
     global tags_found
 
@@ -50,18 +104,122 @@ def extract_tags(kds_set_file):
         return
 
     print(f"Extracting tags from: {kds_set_file}")
-    with open(f"{kds_set_file}", "r", encoding="utf-8") as f:
-        # every line is a JSON object
-        for line_number, line in enumerate(f, 1):
-            try:
-                data = json.loads(line)
-            except json.JSONDecodeError:
-                print(f"Error parsing {kds_set_file.name} at line {line_number}")
+    census = census_tags(kds_set_file)
+    tags_found.update(census["tags"])
+    return census
+
+
+def census_worker(job):
+    lang, pos, path = job
+    census = census_tags(Path(path))
+    return lang, pos, path, census
+
+
+def get_filters_key() -> str:
+    """
+    Identify the filters a census is counted with: the blacklisted tags
+    and the check of malformed words (its code and blacklisted characters)
+    """
+    key = json.dumps(
+        [
+            __blacklisted_tags__,
+            __blacklisted_characters__,
+            inspect.getsource(is_word_malformed),
+        ]
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def load_census_cache(cache_file) -> dict:
+    if not cache_file.exists():
+        return {}
+
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def census_from_all_wordsets(wordsets_json_path, cache_file, processes=None):
+    """
+    Use wordsets.json to get the census of every set listed.
+    Sets are read in parallel, skipping the ones that didn't
+    change since the cached census was made with the same filters.
+    """
+    with open(wordsets_json_path, mode="r", encoding="utf-8") as f:
+        wordsets = json.load(f)
+
+    cache = load_census_cache(cache_file)
+    filters_key = get_filters_key()
+    results = {}
+    jobs = []
+    for set in wordsets:
+        for pos in ["noun", "adj"]:
+            kds_set_file = Path(set[pos]).resolve()
+            if not kds_set_file.exists():
+                print(f'File "{kds_set_file}" does not exists')
                 continue
-            data = json.loads(line)
-            tags = get_word_tags(data=data)
-            for tag in tags:
-                tags_found.add(tag)
+
+            path = fspath(kds_set_file)
+            cached = cache.get(path)
+            if (
+                cached
+                and cached["signature"] == file_signature(kds_set_file)
+                and cached.get("filters") == filters_key
+            ):
+                results[path] = cached
+                continue
+            jobs.append((set["lang"], pos, path))
+
+    if jobs:
+        print(f"Extracting tags from {len(jobs)} sets...")
+        with multiprocessing.Pool(processes=processes) as pool:
+            for lang, pos, path, census in pool.imap_unordered(census_worker, jobs):
+                print(f"Extracted tags from: {path}")
+                census["lang"] = lang
+                census["pos"] = pos
+                census["signature"] = file_signature(Path(path))
+                census["filters"] = filters_key
+                results[path] = census
+
+    cache_file.parent.mkdir(exist_ok=True, parents=True)
+    with open(cache_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False))
+
+    return list(results.values())
+
+
+def merge_census(results: list[dict]) -> dict:
+    """Merge the census of every set by language and part of speech"""
+    languages = {}
+    blacklisted = {tag: {"removed": 0, "only": 0} for tag in __blacklisted_tags__}
+    total = Counter()
+
+    for census in results:
+        pos_tags = languages.setdefault(census["lang"], {})
+        pos_tags.setdefault(census["pos"], Counter()).update(census["tags"])
+        total.update(census["tags"])
+
+        for tag in __blacklisted_tags__:
+            blacklisted[tag]["removed"] += census["removed"].get(tag, 0)
+            blacklisted[tag]["only"] += census["only"].get(tag, 0)
+
+    return {"total": total, "languages": languages, "blacklisted": blacklisted}
+
+
+def save_census(census: dict, json_file, csv_file):
+    with open(json_file, "w", encoding="utf-8") as f:
+        f.write(json.dumps(census, ensure_ascii=False, indent=2))
+
+    with open(csv_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["lang", "pos", "tag", "words", "blacklisted"])
+        for lang, pos_tags in sorted(census["languages"].items()):
+            for pos, tags in sorted(pos_tags.items()):
+                for tag, count in tags.most_common():
+                    blacklisted = tag in __blacklisted_tags__
+                    writer.writerow([lang, pos, tag, count, blacklisted])
 
 
 def extract_from_all_wordsets(wordsets_json_path, extracted_tags_file):
@@ -69,20 +227,29 @@ def extract_from_all_wordsets(wordsets_json_path, extracted_tags_file):
     Use wordsets.json located in '../sets' to
     loop and extract all tags the wordsets listed
     """
-    with open(wordsets_json_path, mode="r", encoding="utf-8") as f:
-        wordsets = json.load(f)
+    global tags_found
 
-    for set in wordsets:
-        for kds_set in [set["noun"], set["adj"]]:
-            kds_set_file = Path(kds_set).resolve()
-            extract_tags(kds_set_file)
+    cache_file = extracted_tags_file.with_name("_tags_cache.json")
+    results = census_from_all_wordsets(wordsets_json_path, cache_file)
+    census = merge_census(results)
 
+    tags_found.update(census["total"])
     save_tags(extracted_tags_file)
+    save_census(
+        census,
+        extracted_tags_file.with_suffix(".json"),
+        extracted_tags_file.with_suffix(".csv"),
+    )
+
+    print("Words removed by each blacklisted tag (only by that tag):")
+    for tag, counts in census["blacklisted"].items():
+        print(f"* {tag}: {counts['removed']} ({counts['only']})")
 
 
 if __name__ == "__main__":
     # File to save extracted tags
     # If already exists, previous tags will be also loaded
+    # The census is saved next to it as _tags.json and _tags.csv
     extracted_tags_file = Path(f"./_tags.txt").resolve()
 
     # Sets folder path (the one with .kds files)
@@ -99,10 +266,8 @@ if __name__ == "__main__":
     # save_tags(extracted_tags_file)
 
     if not wordsets_json_path.exists():
-        print(
-            """No wordsets.json file found,
-            please run build_data.py before executing this script"""
-        )
+        print("""No wordsets.json file found,
+            please run build_data.py before executing this script""")
         sys.exit(1)
 
     # * Loop all sets
@@ -0,0 +1,172 @@
+"""
+Size aware scheduling of language jobs for process pools.
+
+Jobs are dispatched largest-first so a huge language can't be left for
+last and dominate the total time. Oversized sets are split into chunks
+aligned to line boundaries, and file (or network) access is limited by
+its own semaphore, independently from the number of CPU workers.
+"""
+
+import json
+import logging
+import multiprocessing
+import time
+import urllib.error
+import urllib.request
+from contextlib import nullcontext
+from os import fspath
+from pathlib import Path
+
+# * Measured throughput (bytes per second) of previous runs
+throughput_path = Path(".cache") / "throughput.json"
+
+# Sets bigger than this are split into chunks of (about) this size
+default_chunk_size = 64 * 1024 * 1024
+
+# * Semaphore limiting concurrent I/O inside the workers
+__io_slots__ = None
+
+
+def init_worker(io_slots=None):
+    global __io_slots__
+    __io_slots__ = io_slots
+
+
+def io_slot():
+    """
+    Context manager used by workers to wrap any file reading or downloading.
+    Outside of a scheduled pool, it does nothing.
+    """
+    if __io_slots__ is None:
+        return nullcontext()
+    return __io_slots__
+
+
+def get_file_size(path) -> int:
+    try:
+        return Path(path).stat().st_size
+    except OSError:
+        return 0
+
+
+def get_remote_size(url) -> int:
+    """Get the size of a remote file from the Content-Length header"""
+    request = urllib.request.Request(url, method="HEAD")
+    try:
+        with urllib.request.urlopen(request) as r:
+            return int(r.headers.get("Content-Length") or 0)
+    except (urllib.error.URLError, ValueError) as err:
+        logging.debug(f"Cannot get the size of {url}: {err}")
+        return 0
+
+
+def get_wordset_size(wordSet: dict) -> int:
+    """Get the size of a wordset (as returned by `get_wordsets`)"""
+    return get_file_size(wordSet["noun"]) + get_file_size(wordSet["adj"])
+
+
+def split_file(path, chunk_size=default_chunk_size) -> list[tuple[int, int]]:
+    """
+    Split a file in (start, end) byte ranges of about `chunk_size` bytes.
+    Every range starts at the beginning of a line and ends after a newline
+    (or at the end of the file), so no line is ever split in two.
+    """
+    size = get_file_size(path)
+    if size <= chunk_size:
+        return [(0, size)]
+
+    ranges = []
+    start = 0
+    with open(fspath(path), "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+
+def order_by_size(jobs: list[dict]) -> list[dict]:
+    """Sort the jobs from the largest to the smallest"""
+    return sorted(jobs, key=lambda job: job["size"], reverse=True)
+
+
+def load_throughput(kind: str):
+    if not throughput_path.exists():
+        return None
+
+    try:
+        with open(throughput_path, "r", encoding="utf-8") as f:
+            return json.load(f).get(kind)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def save_throughput(kind: str, total_bytes: int, elapsed: float):
+    """Save the measured bytes per second, averaged with previous runs"""
+    if total_bytes <= 0 or elapsed <= 0:
+        return
+
+    measured = total_bytes / elapsed
+    previous = load_throughput(kind)
+    if previous:
+        measured = (measured + previous) / 2
+
+    data = {}
+    if throughput_path.exists():
+        try:
+            with open(throughput_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            data = {}
+
+    data[kind] = measured
+    throughput_path.parent.mkdir(exist_ok=True, parents=True)
+    with open(throughput_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, indent=2))
+
+
+def estimate_time(total_bytes: int, kind: str):
+    """Estimated seconds to process the given bytes, None if never measured"""
+    rate = load_throughput(kind)
+    if not rate:
+        return None
+    return total_bytes / rate
+
+
+def run_jobs(func, jobs: list[dict], kind: str, processes=None, io_limit=None):
+    """
+    Run `func(job)` for every job in a process pool, largest job first.
+    Every job is a dict with at least a "size" key (in bytes).
+    Yields every (job, result) as soon as it's completed.
+    """
+    jobs = order_by_size(jobs)
+    total_bytes = sum(job["size"] for job in jobs)
+
+    eta = estimate_time(total_bytes, kind)
+    if eta is not None:
+        logging.info(f"Estimated time to complete {kind}: {eta:.1f} seconds")
+
+    io_slots = None
+    if io_limit is not None and io_limit > 0:
+        io_slots = multiprocessing.BoundedSemaphore(io_limit)
+
+    done_bytes = 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(
+        processes=processes, initializer=init_worker, initargs=(io_slots,)
+    ) as pool:
+        for job, result in pool.imap_unordered(func, jobs, chunksize=1):
+            done_bytes += job["size"]
+            elapsed = time.perf_counter() - started
+
+            if 0 < done_bytes < total_bytes:
+                remaining = (total_bytes - done_bytes) / (done_bytes / elapsed)
+                logging.info(
+                    f"{done_bytes}/{total_bytes} bytes done, about {remaining:.1f} seconds left"
+                )
+            yield job, result
+
+    save_throughput(kind, total_bytes, time.perf_counter() - started)
@@ -0,0 +1,315 @@
+"""
+Word sets with a memory budget.
+
+Past the budget, the words are spilled to sorted runs on disk, which are
+k-way merged (and deduplicated) when the dictionary is saved.
+"""
+
+import heapq
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from itertools import count
+from pathlib import Path
+
+# Default folder for the spilled runs
+spill_path = Path(".cache") / "spill"
+
+# Rough memory used by a dict entry and its place in a length bucket
+# (besides the word itself)
+entry_overhead = 80
+
+# Runs are merged into one when there are too many files to open at once
+max_runs = 64
+
+
+class MemoryBudget:
+    """
+    Shared memory budget (in bytes) of a group of stores.
+    Every word added to a store gets the next position of the budget, so
+    the positions of a language's words and blacklist can be compared.
+    """
+
+    def __init__(self, limit=None, directory=spill_path):
+        self.limit = limit
+        self.directory = Path(directory)
+        self.stores: list["WordStore"] = []
+        self.position = 0
+
+    def next_position(self) -> int:
+        position = self.position
+        self.position += 1
+        return position
+
+    @property
+    def used(self) -> int:
+        return sum(store.size for store in self.stores)
+
+    def check(self):
+        """Spill the biggest store while the budget is exceeded"""
+        if self.limit is None:
+            return
+
+        while self.used > self.limit:
+            biggest = max(self.stores, key=lambda store: store.size)
+            if not biggest.size:
+                break
+            biggest.spill()
+
+
+class WordStore:
+    """
+    Insertion-ordered set of words that spills to disk past its budget.
+    Words are also collected in buckets by length, in the order they were
+    found, so they are saved sorted by length without sorting them.
+
+    Only the words kept in memory are checked with `in`. Words found after
+    being spilled are saved again, so `ordered` compares their first
+    position with the first position of the words in the `blacklist`
+    to keep exactly the same words as the in-memory sets.
+    """
+
+    def __init__(self, budget=None, blacklist=None):
+        self.budget = budget if budget is not None else MemoryBudget()
+        self.budget.stores.append(self)
+        self.blacklist = blacklist
+        self.words: dict[str, int] = {}
+        self.lengths: dict[int, list[str]] = {}
+        self.runs: list[Path] = []
+        self.size = 0
+        self._directory = None
+        self._files = count()
+
+        # * Files of the words in memory saved by previous checkpoints, and
+        # * the position from which words were not saved yet
+        self._token = uuid.uuid4().hex[:8]
+        self._segments: list[str] = []
+        self._checkpointed = 0
+
+    def __contains__(self, word) -> bool:
+        return word in self.words
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    @property
+    def spilled(self) -> bool:
+        return bool(self.runs)
+
+    def add(self, word: str):
+        if word in self.words:
+            return
+
+        self.words[word] = self.budget.next_position()
+        self.lengths.setdefault(len(word), []).append(word)
+        self.size += sys.getsizeof(word) + entry_overhead
+        self.budget.check()
+
+    def checkpoint(self, directory: Path) -> dict:
+        """
+        Save the store to `directory`, writing only what changed since the
+        previous checkpoint: spilled runs are linked, and only the words
+        added to memory since then are written to a new segment.
+        Returns the names of the files to restore the store from.
+        """
+        directory.mkdir(exist_ok=True, parents=True)
+
+        runs = []
+        for run in self.runs:
+            name = f"{self._token}-{run.name}"
+            link_file(run, directory / name)
+            runs.append(name)
+
+        # * Words are added with increasing positions, so the new
+        # * ones are the last words in memory
+        added = []
+        for word, position in reversed(self.words.items()):
+            if position < self._checkpointed:
+                break
+            added.append((word, position))
+
+        if added:
+            name = f"{self._token}-segment-{next(self._files)}.run"
+            write_run(directory / name, reversed(added))
+            self._segments.append(name)
+        self._checkpointed = self.budget.position
+
+        return {"runs": runs, "segments": list(self._segments)}
+
+    def restore(self, directory: Path, files: dict):
+        """Add back a store saved by `checkpoint`, keeping the positions"""
+        for name in files["runs"]:
+            path = self._new_run_path()
+            link_file(directory / name, path)
+            self.runs.append(path)
+
+        for name in files["segments"]:
+            for word, position in read_run(directory / name):
+                if word in self.words:
+                    continue
+                self.words[word] = position
+                self.lengths.setdefault(len(word), []).append(word)
+                self.size += sys.getsizeof(word) + entry_overhead
+                self.budget.check()
+
+    def _new_run_path(self) -> Path:
+        if self._directory is None:
+            self.budget.directory.mkdir(exist_ok=True, parents=True)
+            self._directory = Path(tempfile.mkdtemp(dir=self.budget.directory))
+        return self._directory / f"{next(self._files)}.run"
+
+    def spill(self):
+        """Save the words in memory to a new run sorted by word"""
+        path = self._new_run_path()
+        logging.debug(f"Spilling {len(self.words)} words to {path}")
+        write_run(path, sorted(self.words.items()))
+
+        self.runs.append(path)
+        self.words.clear()
+        self.lengths.clear()
+        self.size = 0
+
+        # The words of the checkpoint segments are now in the run
+        self._segments = []
+
+        if len(self.runs) >= max_runs:
+            self.compact()
+
+    def compact(self):
+        """Merge all the runs into a single one"""
+        path = self._new_run_path()
+        streams = [read_run(run) for run in self.runs]
+        write_run(path, first_of_each(heapq.merge(*streams)))
+
+        for run in self.runs:
+            run.unlink()
+        self.runs = [path]
+
+    def iter_sorted(self):
+        """All the (word, position) pairs, sorted by word and position"""
+        streams = [read_run(path) for path in self.runs]
+        streams.append(iter(sorted(self.words.items())))
+        return heapq.merge(*streams)
+
+    def iter_first(self):
+        """The first (word, position) of every word, sorted by word"""
+        return first_of_each(self.iter_sorted())
+
+    def ordered(self):
+        """
+        The accepted words sorted by length. Words with the same
+        length keep the order in which they were first found.
+        """
+        blacklist = self.blacklist
+        if not self.spilled and (blacklist is None or not blacklist.spilled):
+            lengths = self.lengths
+            return (word for length in sorted(lengths) for word in lengths[length])
+
+        accepted = join_blacklist(self.iter_first(), blacklist)
+        return (word for word, _ in sort_by_length(accepted, self.budget))
+
+    def clear(self):
+        self.words.clear()
+        self.lengths.clear()
+        self.size = 0
+        self.runs = []
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def close(self):
+        self.clear()
+        if self in self.budget.stores:
+            self.budget.stores.remove(self)
+
+
+def first_of_each(entries):
+    """Deduplicate (word, position) pairs sorted by word and position"""
+    last = None
+    for word, position in entries:
+        if word != last:
+            last = word
+            yield word, position
+
+
+def link_file(source: Path, destination: Path):
+    """Hard link a file (or copy it, if it can't be linked) unless it exists"""
+    if destination.exists():
+        return
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def write_run(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write("\n")
+
+
+def read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            word, position = json.loads(line)
+            yield word, position
+
+
+def join_blacklist(words, blacklist):
+    """
+    Drop the (word, position) pairs that were blacklisted before being found.
+    Both streams must be sorted by word.
+    """
+    if blacklist is None:
+        yield from words
+        return
+
+    blacklisted = blacklist.iter_first()
+    current = next(blacklisted, None)
+    for word, position in words:
+        while current is not None and current[0] < word:
+            current = next(blacklisted, None)
+
+        if current is not None and current[0] == word and current[1] < position:
+            continue
+        yield word, position
+
+
+def sort_by_length(entries, budget: MemoryBudget):
+    """External sort of (word, position) pairs by length and position"""
+
+    def key(entry):
+        return len(entry[0]), entry[1]
+
+    limit = budget.limit
+    runs = []
+    directory = None
+    buffer = []
+    size = 0
+    for entry in entries:
+        buffer.append(entry)
+        size += sys.getsizeof(entry[0]) + entry_overhead
+        if limit is not None and size > limit:
+            if directory is None:
+                budget.directory.mkdir(exist_ok=True, parents=True)
+                directory = Path(tempfile.mkdtemp(dir=budget.directory))
+            path = directory / f"sorted-{len(runs)}.run"
+            write_run(path, sorted(buffer, key=key))
+            runs.append(path)
+            buffer = []
+            size = 0
+
+    buffer.sort(key=key)
+    try:
+        yield from heapq.merge(*[read_run(path) for path in runs], buffer, key=key)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)